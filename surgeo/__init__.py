@@ -45,11 +45,12 @@ if sys.hexversion < 0x03000000:
 
 
 # Put SurgeoModel, SurgeoResult, and SurgeoError in surgeo namespace
+import importlib
+import os
+
 import surgeo
-import surgeo.db
 import surgeo.model
 import surgeo.utilities
-import surgeo.experimental
 
 from surgeo.utilities.error_class import SurgeoError
 
@@ -65,26 +66,89 @@ from surgeo.utilities.geo_class import GeoModel
 from surgeo.utilities.geo_class import GeoResult
 from surgeo.utilities.geo_class import GeoErrorResult
 
+from surgeo.utilities.batch_class import SurgeoResultBatch
+
+# Subpackages imported on first use. surgeo.db pulls in the download
+# machinery (ftplib, urllib, zipfile), which scoring never needs.
+_LAZY_SUBMODULES = ('db', 'experimental')
+
+
+def __getattr__(name):
+    if name in _LAZY_SUBMODULES:
+        return importlib.import_module('surgeo.' + name)
+    raise AttributeError('module \'surgeo\' has no attribute '
+                         '\'{}\''.format(name))
+
 
-def data_setup(verbose=True):
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_SUBMODULES))
+
+
+def data_setup(verbose=True, from_dir=None, jobs=1, rebuild=False):
     '''Downloads data needed to instantiate SurgeoModel.
 
     Args:
         verbose: True/False determines whether text is output.
+        from_dir: directory or mirror already holding the census archives
+            (names.zip, *geo_uf1.zip, *00002_uf1.zip); nothing is then
+            downloaded
+        jobs: number of processes parsing the state archives
+        rebuild: True to discard census.db and build it from scratch
     Returns:
         None
     Raises:
-        None
+        SurgeoError: if archives are missing or cannot be downloaded
+
+    The database is built in census.db.build and only published over
+    census.db (copied with the sqlite backup API, then renamed into place)
+    once complete, so scoring never sees a partly built database, and the
+    previous census.db stays in use until then. Each stage, and each state
+    archive, is checkpointed in the build's build_manifest table as it is
+    committed. If setup fails partway, running it again continues after
+    the last completed unit; once census.db is complete and no build is
+    pending, it does nothing unless rebuild is True.
 
     '''
 
+    import surgeo.db
     # Create necessary user data in home directory
     surgeo.utilities.setup_folder(verbose)
-    # Setup surname db
-    surgeo.db.setup_surname_table(verbose)
-    # Setup race db
-    surgeo.db.setup_geocode_table(verbose)
-    # Reconstitute items supressed for confidentiality and index
-    surgeo.db.reconstitute_data()
+    db_path = os.path.join(os.path.expanduser('~'), '.surgeo', 'census.db')
+    build_path = db_path + surgeo.db.db_build.BUILD_SUFFIX
+    # A build left by a failed run (a rebuild too) is pending until done
+    if (not rebuild and not os.path.exists(build_path) and
+            surgeo.db.is_build_complete(db_path)):
+        if verbose is True:
+            sys.stdout.write('Database already built. Use --rebuild to '
+                             'build it again.\n')
+        return
+    # Resume an interrupted build, unless a clean one is asked for. A build
+    # that completed but was not published only needs publishing.
+    if not surgeo.db.prepare_build(build_path, rebuild):
+        # Find or download (in parallel, resumably) the census archives
+        surname_archive, geocode_archives = surgeo.db.stage_archives(
+            verbose, from_dir)
+        try:
+            # Setup surname db
+            surgeo.db.setup_surname_table(verbose, surname_archive,
+                                          build_path)
+            # Setup race db
+            surgeo.db.setup_geocode_table(verbose, geocode_archives, jobs,
+                                          build_path)
+        except Exception:
+            # Downloaded archives are kept between runs, so a corrupt one
+            # would fail every later setup. Drop it to fetch it again.
+            if from_dir is None:
+                surgeo.db.drop_bad_archives(
+                    verbose, [surname_archive] + geocode_archives)
+            raise
+        # Reconstitute items supressed for confidentiality and index
+        surgeo.db.reconstitute_data(build_path)
+        # Precompute race probabilities for each zcta, then move to the
+        # current schema (typed tables keyed for lookups) and analyze
+        surgeo.db.migrate_db(verbose, build_path)
+        surgeo.db.mark_build_complete(build_path)
+    # Swap the finished database in for readers in one step
+    surgeo.db.publish_build(verbose, build_path, db_path)
     # Remove zip and other unnecessary files
     surgeo.utilities.folder_cleanup()
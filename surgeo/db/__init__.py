@@ -1,5 +1,12 @@
-
 # Add functions to surgeo.db namespace
 from surgeo.db.unsupress import reconstitute_data
 from surgeo.db.db_setup_geocode import setup_geocode_table
 from surgeo.db.db_setup_surname import setup_surname_table
+from surgeo.db.db_setup_zcta import setup_zcta_race_table
+from surgeo.db.db_migrate import migrate_db
+from surgeo.db.staging import stage_archives
+from surgeo.db.staging import drop_bad_archives
+from surgeo.db.db_build import prepare_build
+from surgeo.db.db_build import mark_build_complete
+from surgeo.db.db_build import is_build_complete
+from surgeo.db.db_build import publish_build
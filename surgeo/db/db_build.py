@@ -0,0 +1,190 @@
+import itertools
+import os
+import sqlite3
+import sys
+
+import surgeo.model.connection
+
+# Rows per executemany call while loading
+INSERT_BATCH_SIZE = 10000
+
+# PRAGMAs for a connection that bulk loads census.db. Each unit of the
+# build (a file, a stage) is one transaction that must roll back cleanly
+# if it fails, so a rollback journal is kept; syncing to disk after every
+# write is not worth its cost for data that can be rebuilt.
+BUILD_PRAGMAS = (('journal_mode', 'TRUNCATE'),
+                 ('synchronous', 'OFF'),
+                 ('cache_size', -65536),
+                 ('temp_store', 'MEMORY'))
+
+# Units of the build that have been committed, as (stage, unit). A unit is
+# recorded in the transaction that loads it, so the table never disagrees
+# with the data.
+MANIFEST_SCHEMA = '''CREATE TABLE IF NOT EXISTS build_manifest(
+                     stage TEXT NOT NULL, unit TEXT NOT NULL, rows INTEGER,
+                     completed TEXT, PRIMARY KEY(stage, unit))'''
+
+# Stage recorded once every other stage is done
+COMPLETE_STAGE = 'complete'
+
+# The database is built in db_path + BUILD_SUFFIX, next to db_path, and
+# only published over db_path once complete
+BUILD_SUFFIX = '.build'
+# Pages copied per step of the backup that publishes a build
+BACKUP_PAGES = 4096
+
+
+def connect_for_build(db_path):
+    '''Opens db_path for bulk loading, in manual transaction mode.
+
+    Args:
+        db_path: file path of the database to build
+    Returns:
+        Sqlite3 database connection instance
+    Raises:
+        sqlite3.Error: if the database cannot be opened
+
+    The connection has isolation_level None, so the caller brackets each
+    unit of the load, table and index creation included, with BEGIN and
+    COMMIT.
+
+    '''
+
+    connection = sqlite3.connect(db_path, isolation_level=None)
+    for pragma, value in BUILD_PRAGMAS:
+        connection.execute('PRAGMA {}={}'.format(pragma, value))
+    return connection
+
+
+def iter_batches(rows, size=INSERT_BATCH_SIZE):
+    '''Yields lists of up to size rows from any iterable of rows.'''
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def has_manifest(connection):
+    '''True if the database records its build in build_manifest.'''
+    return has_table(connection, 'build_manifest')
+
+
+def has_table(connection, table):
+    return connection.execute('''SELECT 1 FROM sqlite_master WHERE
+                                 type='table' AND name=?''',
+                              (table,)).fetchone() is not None
+
+
+def get_completed_units(connection, stage):
+    '''Returns the set of units of stage that have been committed.'''
+    if not has_manifest(connection):
+        return set()
+    return set(row[0] for row in connection.execute(
+        '''SELECT unit FROM build_manifest WHERE stage=?''', (stage,)))
+
+
+def mark_completed(cursor, stage, unit='', rows=None):
+    '''Records a unit as done. Call inside the unit's own transaction.'''
+    cursor.execute(MANIFEST_SCHEMA)
+    cursor.execute('''INSERT OR REPLACE INTO build_manifest VALUES(?, ?, ?,
+                      datetime('now'))''', (stage, unit, rows))
+
+
+def mark_build_complete(db_path):
+    '''Records that every stage of the build of db_path is done.'''
+    connection = sqlite3.connect(db_path)
+    try:
+        mark_completed(connection.cursor(), COMPLETE_STAGE)
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def is_build_complete(db_path):
+    '''True if db_path exists and records a complete build.'''
+    if not os.path.exists(db_path):
+        return False
+    connection = sqlite3.connect(db_path)
+    try:
+        return bool(get_completed_units(connection, COMPLETE_STAGE))
+    finally:
+        connection.close()
+
+
+def prepare_build(db_path, rebuild=False):
+    '''Readies db_path for a build, keeping the units already completed.
+
+    Args:
+        db_path: file path of the database to build
+        rebuild: True to discard any existing database
+    Returns:
+        True if db_path already holds a complete build, else False
+    Raises:
+        sqlite3.Error: if an existing database cannot be read
+
+    A database without a build_manifest (built by an earlier version, or
+    not by setup) cannot be resumed and is removed, as it is with rebuild.
+
+    '''
+
+    if os.path.exists(db_path) and not rebuild:
+        connection = sqlite3.connect(db_path)
+        try:
+            if has_manifest(connection):
+                return bool(get_completed_units(connection, COMPLETE_STAGE))
+        finally:
+            connection.close()
+    for path in (db_path, db_path + '-journal'):
+        if os.path.exists(path):
+            os.remove(path)
+    return False
+
+
+def publish_build(verbose, build_path, db_path):
+    '''Copies a complete build over db_path in one atomic step.
+
+    Args:
+        verbose: True/False for whether function outputs info.
+        build_path: file path of the built database
+        db_path: file path the database is published at
+    Returns:
+        None
+    Raises:
+        sqlite3.Error: if the build cannot be copied
+
+    The build is copied with the sqlite backup API into a file beside
+    db_path, which is then renamed over it, so a reader opening db_path
+    finds either the previous database or the new one, never a mix of
+    the two. Models already running keep reading the previous database
+    through their pins (see surgeo.model.connection). The build file is
+    removed once published.
+
+    '''
+
+    if verbose is True:
+        sys.stdout.write('Publishing database ... \t\t\t')
+        sys.stdout.flush()
+    temp_path = db_path + '.tmp'
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    source = sqlite3.connect(build_path)
+    target = sqlite3.connect(temp_path)
+    try:
+        source.backup(target, pages=BACKUP_PAGES)
+    except sqlite3.Error:
+        target.close()
+        os.remove(temp_path)
+        raise
+    finally:
+        source.close()
+    target.close()
+    os.replace(temp_path, db_path)
+    # The previous build stays only while a running model pins it
+    surgeo.model.connection.sweep_pins(db_path)
+    for path in (build_path, build_path + '-journal'):
+        if os.path.exists(path):
+            os.remove(path)
+    if verbose is True:
+        sys.stdout.write('OK\n')
@@ -0,0 +1,122 @@
+import os
+import sqlite3
+import sys
+import traceback
+
+import surgeo
+import surgeo.model.lookup
+from surgeo.db.db_setup_zcta import setup_zcta_race_table
+
+# PRAGMA user_version of a database in the current schema
+SCHEMA_VERSION = 2
+
+# Schema v2. Columns are typed for what they hold, and each table is a
+# WITHOUT ROWID table clustered on the key the model looks rows up by, so
+# the table b-tree is itself the covering index for the model's queries.
+#   surname_data: name -> six percentages (first row per name kept)
+#   geocode_data: (zcta, id) -> state, logical_record; id keeps file order
+#   logical_race_data: (logical_record, state) -> six counts (first row
+#   per key kept)
+#   zcta_race_prob: zcta -> six probabilities (see setup_zcta_race_table)
+V2_TABLES = (
+    ('surname_data',
+     '''CREATE TABLE surname_data_v2(name TEXT NOT NULL PRIMARY KEY,
+        rank INTEGER, count INTEGER, prop1000K REAL, cum_prop100K REAL,
+        pctwhite REAL, pctblack REAL, pctapi REAL, pctaian REAL,
+        pct2prace REAL, pcthispanic REAL) WITHOUT ROWID''',
+     '''INSERT OR IGNORE INTO surname_data_v2 SELECT name, rank, count,
+        prop1000K, cum_prop100K, pctwhite, pctblack, pctapi, pctaian,
+        pct2prace, pcthispanic FROM surname_data WHERE name IS NOT NULL
+        ORDER BY id'''),
+    ('geocode_data',
+     '''CREATE TABLE geocode_data_v2(zcta TEXT NOT NULL, id INTEGER NOT NULL,
+        state TEXT, summary_level TEXT, logical_record TEXT,
+        PRIMARY KEY(zcta, id)) WITHOUT ROWID''',
+     '''INSERT INTO geocode_data_v2 SELECT zcta, id, state, summary_level,
+        logical_record FROM geocode_data WHERE zcta IS NOT NULL'''),
+    ('logical_race_data',
+     '''CREATE TABLE logical_race_data_v2(logical_record TEXT NOT NULL,
+        state TEXT NOT NULL, num_white INTEGER, num_black INTEGER,
+        num_ai INTEGER, num_api INTEGER, num_hispanic INTEGER,
+        num_multi INTEGER, PRIMARY KEY(logical_record, state))
+        WITHOUT ROWID''',
+     '''INSERT OR IGNORE INTO logical_race_data_v2 SELECT logical_record,
+        state, num_white, num_black, num_ai, num_api, num_hispanic,
+        num_multi FROM logical_race_data WHERE logical_record IS NOT NULL
+        AND state IS NOT NULL ORDER BY id'''),
+)
+
+
+def migrate_db(verbose, db_path=None):
+    '''Upgrades census.db in place to schema v2 and refreshes statistics.
+
+    Args:
+        verbose: True/False for whether function outputs info.
+        db_path: file path of census.db (default: ~/.surgeo/census.db)
+    Returns:
+        None
+    Raises:
+        SurgeoError: if db_path does not exist
+
+    Tables are copied into their v2 form and swapped in within a single
+    transaction, so an interrupted migration leaves the v1 database as it
+    was. zcta_race_prob is rebuilt first, in its v2 form. Rows that a
+    lookup could never reach (later duplicates of a surname or of a
+    logical record) are dropped; scores do not change. A database that is
+    already v2 is only re-analyzed.
+
+    Models open census.db as immutable, so run this only while no model
+    has it open, and rebuild any pack afterwards (the 'pack' engine does so
+    itself, as census.db is then newer than the pack).
+
+    '''
+
+    if db_path is None:
+        db_path = os.path.join(os.path.expanduser('~'),
+                               '.surgeo',
+                               'census.db')
+    if not os.path.exists(db_path):
+        raise surgeo.SurgeoError('No database at {}. Run surgeo --setup '
+                                 'first.'.format(db_path))
+    connection = sqlite3.connect(db_path)
+    version = surgeo.model.lookup.get_schema_version(connection)
+    connection.close()
+    if version < SCHEMA_VERSION:
+        setup_zcta_race_table(verbose, db_path)
+        if verbose is True:
+            sys.stdout.write('Migrating database to schema v{} ... \t'
+                             .format(SCHEMA_VERSION))
+            sys.stdout.flush()
+        # Explicit transaction: the DDL is rolled back with the data
+        connection = sqlite3.connect(db_path, isolation_level=None)
+        try:
+            cursor = connection.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            for table, create_sql, copy_sql in V2_TABLES:
+                cursor.execute('DROP TABLE IF EXISTS {}_v2'.format(table))
+                cursor.execute(create_sql)
+                cursor.execute(copy_sql)
+                # The v1 indexes go with the v1 table
+                cursor.execute('DROP TABLE {}'.format(table))
+                cursor.execute('ALTER TABLE {0}_v2 RENAME TO {0}'
+                               .format(table))
+            cursor.execute('PRAGMA user_version={}'.format(SCHEMA_VERSION))
+            cursor.execute('COMMIT')
+        except sqlite3.Error as e:
+            traceback.print_exc()
+            connection.rollback()
+            connection.close()
+            raise e
+        if verbose is True:
+            sys.stdout.write('OK\n')
+    else:
+        connection = sqlite3.connect(db_path, isolation_level=None)
+    if verbose is True:
+        sys.stdout.write('Analyzing and compacting ... \t\t\t')
+        sys.stdout.flush()
+    # Planner statistics for the new tables, then drop the v1 pages
+    connection.execute('ANALYZE')
+    connection.execute('VACUUM')
+    connection.close()
+    if verbose is True:
+        sys.stdout.write('OK\n')
@@ -1,101 +1,90 @@
 
 import collections
-import ftplib
-import itertools
+import io
 import os
 import sqlite3
 import sys
-import time
 import traceback
 import zipfile
 
+import surgeo.db.db_build
+import surgeo.db.staging
 
-def setup_geocode_table(verbose):
+# For 'Other race" Iterative Proportional Fitting is used. Costants here.
+OTHER_RACE_HISPANIC_RATE = float(11.1)/100
+OTHER_RACE_WHITE_RATE = float(70.5)/100
+OTHER_RACE_BLACK_RATE = float(11.3)/100
+OTHER_RACE_API_RATE = float(7.0)/100
+OTHER_RACE_AI_RATE = float(.9)/100
+OTHER_RACE_MULTIRACIAL_RATE = float(.8)/100
+
+# build_manifest stages: one unit per archive, then the indexes
+GEOCODE_STAGE = 'geocode'
+INDEX_STAGE = 'geocode_index'
+
+# Summary level of zcta records in the geographic header
+DESIRED_SUMMARY_LEVEL = '871'
+
+GEOCODE_INSERT = '''INSERT INTO geocode_data(id, state, summary_level,
+                    logical_record, zcta) VALUES(NULL, ?, ?, ?, ?)'''
+RACE_INSERT = '''INSERT INTO logical_race_data(id, state, logical_record,
+                 num_white, num_black, num_ai, num_api, num_hispanic,
+                 num_multi) VALUES(NULL, ?, ?, ?, ?, ?, ?, ?, ?)'''
+
+
+def setup_geocode_table(verbose, zipfile_paths=None, jobs=1,
+                        db_path=None):
     '''This sets up the geocoding database.
 
     Args:
         verbose: True/False for whether function outputs info.
+        zipfile_paths: staged XXgeo_uf1.zip and XX00002_uf1.zip archives
+            (default: downloaded to ~/.surgeo, see surgeo.db.staging)
+        jobs: number of processes parsing archives
+        db_path: database to build (default: ~/.surgeo/census.db)
     Returns:
         None
     Raises:
         None
 
-    This function first downloads a geographic header file for each state. It
-    then downloads file 00002 for each state. These are downloaded in zip
-    format, and then unzipped. It then creates two tables, geocode_data and
-    logical_race_data and populates the database. The geocode_data contains
+    This function uses a geographic header file for each state, and file
+    00002 for each state. These come in zip format, and records are parsed
+    straight from the archives, without extracting them. It then creates
+    two tables, geocode_data and logical_race_data and populates the
+    database. Archives are loaded in file name order, so the row ids of a
+    build do not depend on the directory listing. With jobs > 1 the
+    archives are parsed in a process pool while this process alone writes
+    the rows, in that same order, so the database is the same as with
+    jobs=1. Each archive is loaded in its own transaction, which records
+    it in build_manifest; a rerun after a failure loads only the archives
+    that are not recorded yet. The geocode_data contains
     data for geographic areas. The logical record from the geocode_data
     directly correlates with a specific population in the geographic area,
     which is broken down by race.
 
     '''
-    
-    # For 'Other race" Iterative Proportional Fitting is used. Costants here.
-    OTHER_RACE_HISPANIC_RATE = float(11.1)/100
-    OTHER_RACE_WHITE_RATE = float(70.5)/100
-    OTHER_RACE_BLACK_RATE = float(11.3)/100
-    OTHER_RACE_API_RATE = float(7.0)/100
-    OTHER_RACE_AI_RATE = float(.9)/100
-    OTHER_RACE_MULTIRACIAL_RATE = float(.8)/100
-    
-    if verbose is True:
-        sys.stdout.write('Downloading census files ... \t\t\n')
+
     # Created named tuple for organizing
     home_dir_path = os.path.expanduser("~")
     data_dir_path = os.path.join(home_dir_path, '.surgeo')
-    # Download files from census server.
-    ftp = ftplib.FTP('ftp.census.gov')
-    ftp.login()
-    ftp.cwd('census_2000/datasets/Summary_File_1')
-    # List dir
-    state_list = ftp.nlst()
-    time.sleep(0)
-    # Drop all elements prior to states
-    state_list = itertools.dropwhile(lambda x: x != 'Alabama', state_list)
-    # Make dropwhile object to list
-    state_list = list(state_list)
-    zip_files_downloaded = []
-    for state in state_list:
-        time.sleep(0)
-        ftp.cwd('/')
-        ftp.cwd(''.join(['census_2000/datasets/Summary_File_1',
-                         '/',
-                         state]))
-        file_list = ftp.nlst()
-        for item in file_list:
-            time.sleep(0)
-            if '00002_uf1.zip' in item or 'geo_uf1.zip' in item:
-                if verbose is True:
-                    print(''.join(['Downloading ', item]))
-                file_path = os.path.join(data_dir_path, item)
-                zip_files_downloaded.append(file_path)
-                ftp.retrbinary('RETR ' + item, open(file_path, 'wb+').write)
-    if verbose is True:
-        sys.stdout.write('\t\t\t\t\tOK\n')
-    # unzip files
-    for zipfile_path in zip_files_downloaded:
-        time.sleep(0)
-        # Name of XXgeo_uf1.zip --> XXgeo.uf1
-        # Name of XX00002_uf1.zip --> XX0000.uf1
-        file_component = os.path.basename(zipfile_path).replace('.zip', '')
-        file_component = file_component.replace('_', '.')
-        if verbose is True:
-            print('Writing {}'.format(file_component))
-        dir_component = os.path.dirname(zipfile_path)
-        # Zip file is now and iterator to save on ram.
-        with zipfile.ZipFile(zipfile_path, 'r') as f:
-            with f.open(file_component, 'r') as f2:
-                with open(os.path.join(dir_component,
-                          file_component),
-                          'w+b') as f3:
-                    for line in f2:
-                        f3.write(line)
+    if zipfile_paths is None:
+        # Download files from census server, in parallel.
+        zipfile_paths = surgeo.db.staging.download_all(
+            verbose,
+            surgeo.db.staging.list_census_urls(),
+            data_dir_path)
+    zipfile_paths = sorted(zipfile_paths,
+                           key=lambda path: os.path.basename(path))
+    geo_paths = [path for path in zipfile_paths if is_geo_archive(path)]
+    race_paths = [path for path in zipfile_paths
+                  if path.endswith('00002_uf1.zip')]
     # Now everything has been downloaded. Start commit to db
-    try:
+    if db_path is None:
         db_path = os.path.join(os.path.expanduser('~'),
                                '.surgeo',
                                'census.db')
-        connection = sqlite3.connect(db_path)
+    connection = surgeo.db.db_build.connect_for_build(db_path)
+    try:
         cursor = connection.cursor()
         cursor.execute('''CREATE TABLE IF NOT EXISTS
                           geocode_data(id INTEGER PRIMARY KEY,
@@ -105,138 +94,194 @@ def setup_geocode_table(verbose):
                           INTEGER PRIMARY KEY, state TEXT, logical_record TEXT,
                           num_white REAL, num_black REAL, num_ai REAL,
                           num_api REAL, num_hispanic REAL, num_multi REAL)''')
-        # now start loading to db
-        list_of_filenames = os.listdir(data_dir_path)
-        number_of_filenames = len(list_of_filenames)
-        for index, filename in enumerate(list_of_filenames):
-            time.sleep(0)
-            # First the geographic header file
-            if 'geo.uf1' in filename:
-                if verbose is True:
-                    try:
-                        last_write
-                    except NameError:
-                        last_write = 1
-                    if index > last_write:
-                        sys.stdout.write('\rWriting geoheader: {} of {}'
-                                         .format(index,
-                                                 number_of_filenames))
-                        last_write = index
-                file_path = os.path.join(data_dir_path,
-                                         filename)
-                #
-                DESIRED_SUMMARY_LEVEL = '871'
-                # Only latin1 appears to work, even thoug site specifies ascii
-                with open(file_path, 'r', encoding='latin-1') as f3:
-                    for line in f3:
-                        time.sleep(0)
-                        state = line[6:8]
-                        summary_level = line[8:11]
-                        logical_record = line[18:25]
-                        zcta = line[160:165]
-                        # Only ZCTA wide numbers considered
-                        if not summary_level == DESIRED_SUMMARY_LEVEL:
-                            continue
-                        cursor.execute('''INSERT INTO geocode_data(id,
-                                          state, summary_level, logical_record,
-                                          zcta) VALUES(NULL, ?, ?, ?, ?)''',
-                                       (state,
-                                        summary_level,
-                                        logical_record,
-                                        zcta))
+        # now start loading to db: the geographic header files, then the
+        # race counts. Parsed in jobs processes, written here in order.
+        # Archives loaded by an earlier, interrupted run are skipped.
+        completed = surgeo.db.db_build.get_completed_units(connection,
+                                                           GEOCODE_STAGE)
+        zipfile_paths = [path for path in geo_paths + race_paths
+                         if os.path.basename(path) not in completed]
+        parsed = iter_parsed_archives(zipfile_paths, jobs)
+        for index, (zipfile_path, rows) in enumerate(parsed, 1):
+            if verbose is True:
+                sys.stdout.write('\rWriting census files: {} of {}'
+                                 .format(index, len(zipfile_paths)))
+                sys.stdout.flush()
+            if is_geo_archive(zipfile_path):
+                insert_sql = GEOCODE_INSERT
+            else:
+                insert_sql = RACE_INSERT
+            # One transaction per archive, checkpointed in build_manifest
+            cursor.execute('BEGIN')
+            row_count = 0
+            for batch in surgeo.db.db_build.iter_batches(rows):
+                cursor.executemany(insert_sql, batch)
+                row_count += len(batch)
+            surgeo.db.db_build.mark_completed(cursor,
+                                              GEOCODE_STAGE,
+                                              os.path.basename(zipfile_path),
+                                              row_count)
+            cursor.execute('COMMIT')
         if verbose is True:
-            sys.stdout.write('\rWriting geoheader: {} of {}\n'.format
-                            (number_of_filenames, number_of_filenames))
-        for index, filename in enumerate(list_of_filenames):
-            time.sleep(0)
-            # First the geographic header file
-            if '00002.uf1' in filename:
-                if verbose is True:
-                    try:
-                        last_write
-                        last_write = 1
-                    except NameError:
-                        last_write = 1
-                    if index > last_write:
-                        sys.stdout.write('\rWriting race data: {} of {}'
-                                         .format(index,
-                                                 number_of_filenames))
-                        sys.stdout.flush()
-                        last_write = index
-                file_path = os.path.join(data_dir_path,
-                                         filename)
-                with open(file_path, 'r', encoding='latin-1') as f4:
-                    for line in f4:
-                        # Remainder db input
-                        table_p8 = line.split(',')[86:103]
-                        state = line[5:7]
-                        logical_record = line[15:22]
-                        # Need to translate "Other race" into one of the
-                        # six categories through proportional fitting.
-                        num_other = table_p8[7]
-                        OTHER_RACE_HISPANIC_RATE
-                        OTHER_RACE_WHITE_RATE
-                        OTHER_RACE_BLACK_RATE
-                        OTHER_RACE_API_RATE
-                        OTHER_RACE_AI_RATE
-                        OTHER_RACE_MULTIRACIAL_RATE
-                        other_hispanic = str(round(int(num_other) * 
-                                                   OTHER_RACE_HISPANIC_RATE))
-                        other_white = str(round(int(num_other) * 
-                                                OTHER_RACE_WHITE_RATE))
-                        other_black = str(round(int(num_other) * 
-                                                OTHER_RACE_BLACK_RATE))
-                        other_api = str(round(int(num_other) * 
-                                              OTHER_RACE_API_RATE))
-                        other_ai = str(round(int(num_other) * 
-                                             OTHER_RACE_AI_RATE))
-                        other_multiracial = str(round(int(num_other) * 
-                                                OTHER_RACE_MULTIRACIAL_RATE))
-                        # Breaking up table p8
-                        total_pop = table_p8[0]
-                        total_not_hispanic = table_p8[1]
-                        num_white = str(int(table_p8[2]) + int(other_white))
-                        num_black = str(int(table_p8[3]) + int(other_black))
-                        num_ai = str(int(table_p8[4]) + int(other_ai))
-                        num_asian = table_p8[5]
-                        num_pacisland = table_p8[6]
-                        num_api = str(int(num_asian) + 
-                                      int(num_pacisland) +
-                                      int(other_api))
-                        num_other = table_p8[7]
-                        num_multi = str(int(table_p8[8]) + 
-                                        int(other_multiracial))
-                        num_hispanic = str(int(table_p8[9]) +
-                                           int(other_hispanic))  
-                        cursor.execute('''INSERT INTO logical_race_data(
-                                          id, state, logical_record,
-                                          num_white, num_black,
-                                          num_ai, num_api,
-                                          num_hispanic, num_multi) VALUES(
-                                          NULL, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                                      (state,
-                                       logical_record,
-                                       num_white,
-                                       num_black,
-                                       num_ai,
-                                       num_api,
-                                       num_multi,
-                                       num_hispanic))
-        if verbose is True:
-            sys.stdout.write('\rWriting blockfile: {} of {}\n'
-                             .format(number_of_filenames, number_of_filenames))
+            sys.stdout.write('\n')
             sys.stdout.write('Creating indices ... \t\t\t')
             sys.stdout.flush()
-        cursor.execute('''CREATE INDEX IF NOT EXISTS zcta_index ON
-                          geocode_data(zcta)''')
-        cursor.execute('''CREATE INDEX IF NOT EXISTS logical_record_index ON
-                          logical_race_data(logical_record)''')
-        sys.stdout.write('OK\n')
-        # Now commit
-        connection.commit()
+        # Indexes are built once, after the rows are loaded
+        if not surgeo.db.db_build.get_completed_units(connection,
+                                                      INDEX_STAGE):
+            cursor.execute('BEGIN')
+            cursor.execute('''CREATE INDEX IF NOT EXISTS zcta_index ON
+                              geocode_data(zcta)''')
+            cursor.execute('''CREATE INDEX IF NOT EXISTS logical_record_index
+                              ON logical_race_data(logical_record)''')
+            surgeo.db.db_build.mark_completed(cursor, INDEX_STAGE)
+            # Now commit
+            cursor.execute('COMMIT')
         connection.close()
+        if verbose is True:
+            sys.stdout.write('OK\n')
     except sqlite3.Error as e:
         traceback.print_exc()
         connection.rollback()
         connection.close()
         raise e
+    except BaseException:
+        # A bad archive or an interrupt: drop the archive's partial rows
+        connection.rollback()
+        connection.close()
+        raise
+
+
+def is_geo_archive(zipfile_path):
+    '''True for a geographic header (XXgeo_uf1.zip) archive.'''
+    return zipfile_path.endswith('geo_uf1.zip')
+
+
+def parse_archive(zipfile_path):
+    '''Returns every row an archive adds to its table, as a list.'''
+    if is_geo_archive(zipfile_path):
+        return list(iter_geocode_rows(zipfile_path))
+    return list(iter_race_rows(zipfile_path))
+
+
+def iter_parsed_archives(zipfile_paths, jobs=1):
+    '''Yields (zipfile_path, rows) for each archive, in the order given.
+
+    Args:
+        zipfile_paths: list of census archives
+        jobs: number of processes parsing archives
+    Returns:
+        Generator of (zipfile_path, rows); rows is an iterable of rows
+        ready to insert
+    Raises:
+        None
+
+    With jobs > 1 archives are parsed in a process pool. At most two
+    archives per process are in flight, so memory stays bounded by the
+    size of the largest states no matter how many there are.
+
+    '''
+
+    if jobs <= 1:
+        for zipfile_path in zipfile_paths:
+            if is_geo_archive(zipfile_path):
+                yield zipfile_path, iter_geocode_rows(zipfile_path)
+            else:
+                yield zipfile_path, iter_race_rows(zipfile_path)
+        return
+    # Imported here: only --jobs needs it and it is slow to import
+    import multiprocessing
+    pool = multiprocessing.Pool(jobs)
+    pending = collections.deque()
+    try:
+        for zipfile_path in zipfile_paths:
+            pending.append((zipfile_path,
+                            pool.apply_async(parse_archive,
+                                             (zipfile_path,))))
+            if len(pending) >= jobs * 2:
+                zipfile_path, result = pending.popleft()
+                yield zipfile_path, result.get()
+        while pending:
+            zipfile_path, result = pending.popleft()
+            yield zipfile_path, result.get()
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def open_uf1(zipfile_path):
+    '''Opens the .uf1 member of a census archive as a text stream.
+
+    Args:
+        zipfile_path: XXgeo_uf1.zip or XX00002_uf1.zip archive
+    Returns:
+        Text file object that reads the member as it is decompressed
+    Raises:
+        KeyError: if the archive lacks the member
+
+    '''
+
+    # Name of XXgeo_uf1.zip --> XXgeo.uf1
+    # Name of XX00002_uf1.zip --> XX00002.uf1
+    member = os.path.basename(zipfile_path).replace('.zip', '')
+    member = member.replace('_', '.')
+    archive = zipfile.ZipFile(zipfile_path, 'r')
+    try:
+        # Only latin1 appears to work, even thoug site specifies ascii
+        stream = io.TextIOWrapper(archive.open(member, 'r'),
+                                  encoding='latin-1')
+    finally:
+        # The member stream keeps the archive's file open until closed
+        archive.close()
+    return stream
+
+
+def iter_geocode_rows(zipfile_path):
+    '''Yields geocode_data rows (state, summary_level, logical_record,
+    zcta) for the zcta records of a geographic header archive.'''
+    with open_uf1(zipfile_path) as f3:
+        for line in f3:
+            summary_level = line[8:11]
+            # Only ZCTA wide numbers considered
+            if not summary_level == DESIRED_SUMMARY_LEVEL:
+                continue
+            yield (line[6:8], summary_level, line[18:25], line[160:165])
+
+
+def iter_race_rows(zipfile_path):
+    '''Yields logical_race_data rows for each record of a 00002 archive.
+
+    Rows hold state, logical_record, then the counts in the order the
+    INSERT in setup_geocode_table expects them.
+
+    '''
+    with open_uf1(zipfile_path) as f4:
+        for line in f4:
+            # Remainder db input
+            table_p8 = line.split(',')[86:103]
+            state = line[5:7]
+            logical_record = line[15:22]
+            # Need to translate "Other race" into one of the
+            # six categories through proportional fitting.
+            num_other = int(table_p8[7])
+            other_hispanic = round(num_other * OTHER_RACE_HISPANIC_RATE)
+            other_white = round(num_other * OTHER_RACE_WHITE_RATE)
+            other_black = round(num_other * OTHER_RACE_BLACK_RATE)
+            other_api = round(num_other * OTHER_RACE_API_RATE)
+            other_ai = round(num_other * OTHER_RACE_AI_RATE)
+            other_multiracial = round(num_other *
+                                      OTHER_RACE_MULTIRACIAL_RATE)
+            # Breaking up table p8
+            num_white = int(table_p8[2]) + other_white
+            num_black = int(table_p8[3]) + other_black
+            num_ai = int(table_p8[4]) + other_ai
+            num_api = int(table_p8[5]) + int(table_p8[6]) + other_api
+            num_multi = int(table_p8[8]) + other_multiracial
+            num_hispanic = int(table_p8[9]) + other_hispanic
+            # Multi before hispanic, as the table has always been loaded;
+            # published results depend on it.
+            yield (state, logical_record, num_white, num_black, num_ai,
+                   num_api, num_multi, num_hispanic)
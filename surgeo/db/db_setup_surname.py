@@ -1,119 +1,99 @@
 
-import configparser
-import decimal
+import io
 import os
 import sqlite3
 import sys
-import time
 import traceback
-import urllib.request
 import zipfile
 
+import surgeo.db.db_build
+import surgeo.db.staging
 
-def setup_surname_table(verbose):
+# build_manifest stage of the surname table
+SURNAME_STAGE = 'surname'
+
+
+def setup_surname_table(verbose, zipfile_path=None, db_path=None):
     '''This creates the surname database and does housekeeping.
 
     Args:
         verbose: True/False for whether function outputs info.
+        zipfile_path: staged names.zip (default: downloaded to ~/.surgeo)
+        db_path: database to build (default: ~/.surgeo/census.db)
     Returns:
         None
     Raises:
         None
 
-    This downloads a single census data file which gives the relative ethnic
+    This loads a single census data file which gives the relative ethnic
     makeup for each individual name. It only includes names with over 100
-    instances.
+    instances. The table is loaded in one transaction that also records
+    the 'surname' stage in build_manifest, and is skipped once it is done.
 
     '''
 
     if verbose is True:
         sys.stdout.write('Checking db existence ... \t\t\t')
-    db_path = os.path.join(os.path.expanduser('~'),
-                           '.surgeo',
-                           'census.db')
-    zipfile_path = os.path.join(os.path.expanduser('~'),
-                                '.surgeo',
-                                'data.zip')
-    csv_path = os.path.join(os.path.expanduser('~'),
-                            '.surgeo',
-                            'census_data.csv')
-    if not os.path.exists(db_path):
+    if db_path is None:
+        db_path = os.path.join(os.path.expanduser('~'),
+                               '.surgeo',
+                               'census.db')
+    if not is_surname_stage_done(db_path):
         if verbose is True:
             sys.stdout.write('\nCreating db ... \n')
-        config_path = os.path.join(os.path.expanduser('~'),
-                                   '.surgeo',
-                                   'configuration.txt')
-        parser_instance = configparser.ConfigParser()
-        parser_instance.read(config_path)
-        url = 'http://www2.census.gov/topics/genealogy/2000surnames/names.zip'
-        # No try block for url. If it fails, no point in continuing.
-        #site = urllib.request.urlopen(url)
-        #length_in_bytes = int(site.info()['Content-Length'])
-        if verbose is True:
-            urllib.request.urlretrieve(url,
-                                       zipfile_path,
-                                       download_bar)
-        else:
-            urllib.request.urlretrieve(url,
-                                       zipfile_path)
-        if verbose is True:
-            sys.stdout.write('\n')
+        if zipfile_path is None:
+            # Retried and resumable. If it fails, no point in continuing.
+            zipfile_path = surgeo.db.staging.download_all(
+                verbose,
+                [surgeo.db.staging.SURNAME_URL],
+                os.path.dirname(db_path))[0]
         # Done
         if verbose is True:
             sys.stdout.write('Re-checking folder setup ... \t\t\t')
             sys.stdout.write('OK\n')
-            # Zip file
-            sys.stdout.write('Extracting zip file ... \t\t\t')
-        time.sleep(0)
-        with zipfile.ZipFile(zipfile_path, 'r') as f:
-            data = f.read('app_c.csv')
-        # Write zip data to csv
-        time.sleep(0)
-        with open(csv_path, 'wb+') as f:
-            f.write(data)
-        if verbose is True:
-            sys.stdout.write('OK\n')
-        # Write line by line of csv to db
-        csv_lines = open(csv_path, 'r').readlines()
-        time.sleep(0)
-        csv_length = len(csv_lines)
-        line_count = 0
+        # The csv is parsed as it is decompressed; nothing is extracted
+        with zipfile.ZipFile(zipfile_path, 'r') as archive:
+            member = archive.getinfo('app_c.csv')
+            csv_file = io.TextIOWrapper(archive.open(member, 'r'),
+                                        encoding='latin-1')
         # Create DB
-        connection = sqlite3.connect(db_path)
+        connection = surgeo.db.db_build.connect_for_build(db_path)
         cursor = connection.cursor()
         try:
+            cursor.execute('BEGIN')
             cursor.execute('''CREATE TABLE IF NOT EXISTS surname_data (id
                               INTEGER PRIMARY KEY, name TEXT, rank INTEGER,
                               count INTEGER, prop1000K REAL, cum_prop100K REAL,
                               pctwhite REAL, pctblack REAL, pctapi REAL,
                               pctaian REAL, pct2prace REAL,
                               pcthispanic REAL)''')
-            cursor.execute('''CREATE INDEX IF NOT EXISTS name_index ON
-                              surname_data(name)''')
             # Strip csv header.
-            for line in csv_lines[1:]:
-                time.sleep(0)
-                cursor.execute('''INSERT into surname_data VALUES (NULL, ?, ?,
-                                  ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                               (line.split(',')))
-                line_count += 1
-                percent = int(decimal.Decimal(line_count) /
-                              decimal.Decimal(csv_length) * 100)
+            csv_file.readline()
+            rows = (line.split(',') for line in csv_file)
+            row_count = 0
+            for batch in surgeo.db.db_build.iter_batches(rows):
+                cursor.executemany('''INSERT into surname_data VALUES (NULL,
+                                      ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                                   batch)
+                row_count += len(batch)
                 if verbose is True:
-                    try:
-                        last_written_percent
-                    except NameError:
-                        last_written_percent = 0
-                    # Prevent flicker. Only update when percentage changes
-                    if percent > last_written_percent:
-                        sys.stdout.write('\rItems written: {}%'.
-                                         format(percent))
-                        last_written_percent = percent
+                    # Position in the decompressed csv
+                    percent = (csv_file.buffer.tell() * 100 //
+                               max(member.file_size, 1))
+                    sys.stdout.write('\rItems written: {}%'.format(percent))
+                    sys.stdout.flush()
             if verbose is True:
                 sys.stdout.write('\rItems written: 100%')
                 sys.stdout.write('\n')
                 sys.stdout.write('Db write cleanup ... \t\t\t\t')
-            connection.commit()
+            # Index once, after the rows are in
+            cursor.execute('''CREATE INDEX IF NOT EXISTS name_index ON
+                              surname_data(name)''')
+            surgeo.db.db_build.mark_completed(cursor,
+                                              SURNAME_STAGE,
+                                              os.path.basename(zipfile_path),
+                                              row_count)
+            cursor.execute('COMMIT')
             connection.close()
             if verbose is True:
                 sys.stdout.write('OK\n')
@@ -122,15 +102,29 @@ def setup_surname_table(verbose):
             connection.rollback()
             connection.close()
             raise e
+        except BaseException:
+            # A corrupt archive or an interrupt while streaming: drop the
+            # partial table
+            connection.rollback()
+            connection.close()
+            raise
+        finally:
+            csv_file.close()
     else:
         if verbose is True:
             sys.stdout.write('OK\n')
 
 
-def download_bar(block_count, block_size, total_size):
-    '''Report hook for use in db_setup_in_ram function.'''
-    percentage = int((decimal.Decimal(block_count) *
-                      decimal.Decimal(block_size) /
-                      decimal.Decimal(total_size) * 100))
-    sys.stdout.write('\rDownloading surname data: {}%'.format(str(percentage)))
-    time.sleep(0)
+def is_surname_stage_done(db_path):
+    '''True if db_path already has its surname table loaded.'''
+    if not os.path.exists(db_path):
+        return False
+    connection = sqlite3.connect(db_path)
+    try:
+        if surgeo.db.db_build.has_manifest(connection):
+            return bool(surgeo.db.db_build.get_completed_units(
+                connection, SURNAME_STAGE))
+        # Databases built before build_manifest existed
+        return surgeo.db.db_build.has_table(connection, 'surname_data')
+    finally:
+        connection.close()
@@ -0,0 +1,89 @@
+import os
+import sqlite3
+import sys
+import traceback
+
+import surgeo.model.lookup
+
+
+def setup_zcta_race_table(verbose, db_path=None):
+    '''This creates the denormalized zcta_race_prob table.
+
+    Args:
+        verbose: True/False for whether function outputs info.
+        db_path: database to update (default: ~/.surgeo/census.db)
+    Returns:
+        None
+    Raises:
+        None
+
+    The model needs r(k|i) for a zcta, which otherwise means joining
+    geocode_data to logical_race_data on (state, logical_record) and then
+    normalizing the counts for every lookup. This does the join and the
+    normalization once, with set-based SQL, and stores the six probabilities
+    keyed by zcta. Zctas without any population are left out.
+
+    Requires geocode_data and logical_race_data, in schema v1 or v2. It
+    can be run again on an existing database, in which case the table is
+    rebuilt.
+
+    '''
+
+    if verbose is True:
+        sys.stdout.write('Creating zcta probabilities ... \t\t')
+        sys.stdout.flush()
+    if db_path is None:
+        db_path = os.path.join(os.path.expanduser('~'),
+                               '.surgeo',
+                               'census.db')
+    connection = sqlite3.connect(db_path)
+    try:
+        # Schema v2 race rows have no id; (logical_record, state) is unique
+        if surgeo.model.lookup.get_schema_version(connection) >= 2:
+            race_id = '0'
+        else:
+            race_id = 'r.id'
+        cursor = connection.cursor()
+        cursor.execute('''DROP TABLE IF EXISTS zcta_race_prob''')
+        cursor.execute('''CREATE TABLE zcta_race_prob(zcta TEXT PRIMARY KEY,
+                          prob_hispanic REAL, prob_white REAL,
+                          prob_black REAL, prob_api REAL, prob_ai REAL,
+                          prob_multi REAL) WITHOUT ROWID''')
+        # Only the first geocode row per zcta, and the first race row for
+        # it (hence OR IGNORE and ORDER BY), as in the model. Counts are
+        # INTEGER in schema v2, so total is REAL to avoid integer division.
+        cursor.execute('''INSERT OR IGNORE INTO zcta_race_prob
+                          SELECT zcta,
+                                 num_hispanic / total, num_white / total,
+                                 num_black / total, num_api / total,
+                                 num_ai / total, num_multi / total
+                          FROM (SELECT g.id AS geocode_id, {} AS race_id,
+                                       g.zcta AS zcta,
+                                       r.num_hispanic AS num_hispanic,
+                                       r.num_white AS num_white,
+                                       r.num_black AS num_black,
+                                       r.num_api AS num_api,
+                                       r.num_ai AS num_ai,
+                                       r.num_multi AS num_multi,
+                                       CAST(r.num_hispanic + r.num_white +
+                                            r.num_black + r.num_api +
+                                            r.num_ai + r.num_multi
+                                            AS REAL) AS total
+                                FROM geocode_data AS g
+                                JOIN logical_race_data AS r
+                                ON r.logical_record=g.logical_record
+                                AND r.state=g.state
+                                WHERE g.id=(SELECT MIN(id) FROM
+                                            geocode_data
+                                            WHERE zcta=g.zcta))
+                          WHERE total > 0
+                          ORDER BY geocode_id, race_id'''.format(race_id))
+        connection.commit()
+        connection.close()
+    except sqlite3.Error as e:
+        traceback.print_exc()
+        connection.rollback()
+        connection.close()
+        raise e
+    if verbose is True:
+        sys.stdout.write('OK\n')
@@ -0,0 +1,354 @@
+'''Staging of the census archives that the database is built from.
+
+   The build needs names.zip (surname table) and, for every state, the
+   geographic header XXgeo_uf1.zip and file XX00002_uf1.zip. They are
+   either found in a local directory or mirror (from_dir), searched
+   recursively so a copy of the FTP tree works as is, or downloaded into
+   ~/.surgeo. Downloads run in parallel threads, are retried with backoff
+   and resume from the partial .part file a failed attempt or run left.
+   A file is only moved into place once it has its full length and opens
+   as a zip archive.'''
+
+import concurrent.futures
+import ftplib
+import http.client
+import os
+import shutil
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import zipfile
+import zlib
+
+import surgeo
+
+SURNAME_URL = 'http://www2.census.gov/topics/genealogy/2000surnames/names.zip'
+CENSUS_URL = 'ftp://ftp.census.gov/census_2000/datasets/Summary_File_1'
+
+SURNAME_ARCHIVE = 'names.zip'
+GEOCODE_SUFFIXES = ('geo_uf1.zip', '00002_uf1.zip')
+
+# Parallel downloads. The server, not the cpu, is the limit.
+DOWNLOAD_JOBS = 8
+RETRIES = 5
+# Seconds before the first retry; doubled for each later one
+RETRY_DELAY = 2.0
+TIMEOUT = 60
+BLOCK_SIZE = 1 << 20
+
+# Errors a download is retried on. A truncated transfer surfaces as
+# http.client.IncompleteRead, a corrupt file as zipfile.BadZipFile.
+RETRY_ERRORS = ftplib.all_errors + (http.client.HTTPException,
+                                    zipfile.BadZipFile)
+
+
+def is_permanent_error(error):
+    '''True for errors a retry cannot fix: HTTP 4xx and FTP 5xx replies.
+
+    A 416 never gets here; _download_http takes it to mean the part file
+    is complete.
+
+    '''
+
+    if isinstance(error, urllib.error.HTTPError):
+        return 400 <= error.code < 500
+    return isinstance(error, ftplib.error_perm)
+
+
+def is_geocode_archive(filename):
+    '''True for a state XXgeo_uf1.zip or XX00002_uf1.zip file name.'''
+    return filename.endswith(GEOCODE_SUFFIXES)
+
+
+def stage_archives(verbose,
+                   from_dir=None,
+                   jobs=DOWNLOAD_JOBS,
+                   surname_url=SURNAME_URL,
+                   census_url=CENSUS_URL):
+    '''Makes every census archive available locally.
+
+    Args:
+        verbose: True/False for whether function outputs info.
+        from_dir: local directory or mirror holding the archives, or None
+            to download them
+        jobs: number of parallel downloads
+        surname_url: http(s) or ftp url of names.zip
+        census_url: ftp url of the Summary File 1 state directories
+    Returns:
+        (surname_archive, geocode_archives): path of names.zip and a sorted
+        list of state archive paths
+    Raises:
+        SurgeoError: if archives are missing or a download keeps failing
+
+    '''
+
+    if from_dir is not None:
+        return find_archives(verbose, from_dir)
+    data_dir_path = os.path.join(os.path.expanduser('~'), '.surgeo')
+    if verbose is True:
+        sys.stdout.write('Listing census files ... \t\t\t')
+        sys.stdout.flush()
+    urls = list_census_urls(census_url)
+    if verbose is True:
+        sys.stdout.write('OK\n')
+    urls.append(surname_url)
+    paths = download_all(verbose, urls, data_dir_path, jobs)
+    return paths[-1], sorted(paths[:-1])
+
+
+def find_archives(verbose, from_dir):
+    '''Finds names.zip and the state archives under from_dir.
+
+    Args:
+        verbose: True/False for whether function outputs info.
+        from_dir: directory searched recursively
+    Returns:
+        (surname_archive, geocode_archives), as stage_archives
+    Raises:
+        SurgeoError: if names.zip or every state archive is missing
+
+    The first file found with a given name is used.
+
+    '''
+
+    if verbose is True:
+        sys.stdout.write('Finding census files ... \t\t\t')
+        sys.stdout.flush()
+    found = {}
+    for dir_path, dir_names, file_names in os.walk(from_dir):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            if (file_name == SURNAME_ARCHIVE or
+                    is_geocode_archive(file_name)):
+                found.setdefault(file_name, os.path.join(dir_path, file_name))
+    surname_archive = found.pop(SURNAME_ARCHIVE, None)
+    if surname_archive is None:
+        raise surgeo.SurgeoError('No {} under {}.'.format(SURNAME_ARCHIVE,
+                                                          from_dir))
+    if not found:
+        raise surgeo.SurgeoError('No *{} or *{} archives under {}.'
+                                 .format(GEOCODE_SUFFIXES[0],
+                                         GEOCODE_SUFFIXES[1],
+                                         from_dir))
+    if verbose is True:
+        sys.stdout.write('OK\n')
+    return surname_archive, [found[name] for name in sorted(found)]
+
+
+def list_census_urls(census_url=CENSUS_URL):
+    '''Returns the urls of every state archive on the census ftp server.'''
+    return _retry(_list_census_urls, census_url)
+
+
+def _list_census_urls(census_url):
+    parts = urllib.parse.urlsplit(census_url)
+    ftp = _connect_ftp(parts)
+    try:
+        ftp.cwd(parts.path)
+        # Drop all elements prior to states
+        state_list = ftp.nlst()
+        if 'Alabama' in state_list:
+            state_list = state_list[state_list.index('Alabama'):]
+        urls = []
+        for state in state_list:
+            for item in ftp.nlst(state):
+                # Some servers list 'Alabama/x.zip', others 'x.zip'
+                item = os.path.basename(item)
+                if is_geocode_archive(item):
+                    urls.append('{}/{}/{}'.format(census_url.rstrip('/'),
+                                                  state, item))
+    finally:
+        ftp.close()
+    return urls
+
+
+def download_all(verbose, urls, dir_path, jobs=DOWNLOAD_JOBS):
+    '''Downloads urls into dir_path in parallel and returns their paths.
+
+    Args:
+        verbose: True/False for whether function outputs info.
+        urls: list of http(s) or ftp urls
+        dir_path: directory the files are written to, under their names
+        jobs: number of parallel downloads
+    Returns:
+        List of file paths, in urls order
+    Raises:
+        SurgeoError: if a download still fails after RETRIES attempts
+
+    Files already present are not fetched again, so a rerun after a
+    failure only downloads what is missing. A present file that does not
+    open as a zip archive is fetched again.
+
+    '''
+
+    paths = [os.path.join(dir_path, os.path.basename(
+        urllib.parse.urlsplit(url).path)) for url in urls]
+    pending = [(url, path) for url, path in zip(urls, paths)
+               if not (os.path.exists(path) and zipfile.is_zipfile(path))]
+    with concurrent.futures.ThreadPoolExecutor(max(1, jobs)) as executor:
+        futures = [executor.submit(_retry, download, url, path)
+                   for url, path in pending]
+        for index, future in enumerate(
+                concurrent.futures.as_completed(futures), 1):
+            future.result()
+            if verbose is True:
+                sys.stdout.write('\rDownloading census files: {} of {}'
+                                 .format(index, len(pending)))
+                sys.stdout.flush()
+    if verbose is True and pending:
+        sys.stdout.write('\n')
+    return paths
+
+
+def download(url, file_path):
+    '''Downloads url to file_path, resuming from file_path + '.part'.
+
+    Args:
+        url: http(s) or ftp url
+        file_path: path the file is moved to once complete
+    Returns:
+        None
+    Raises:
+        http.client.IncompleteRead: if the transfer ends short; the .part
+            file is kept so that a retry resumes from it
+        zipfile.BadZipFile: if the file is not a zip archive; the .part
+            file is removed so that a retry starts over
+
+    '''
+
+    part_path = file_path + '.part'
+    if urllib.parse.urlsplit(url).scheme == 'ftp':
+        _download_ftp(url, part_path)
+    else:
+        _download_http(url, part_path)
+    if not zipfile.is_zipfile(part_path):
+        os.remove(part_path)
+        raise zipfile.BadZipFile('{} is not a zip archive'.format(url))
+    os.replace(part_path, file_path)
+
+
+def _download_ftp(url, part_path):
+    parts = urllib.parse.urlsplit(url)
+    offset = _get_size(part_path)
+    ftp = _connect_ftp(parts)
+    try:
+        ftp.voidcmd('TYPE I')
+        try:
+            size = ftp.size(parts.path)
+        except ftplib.error_perm:
+            # SIZE is an extension some servers lack
+            size = None
+        with open(part_path, 'ab') as part_file:
+            # REST continues the transfer at offset
+            ftp.retrbinary('RETR ' + parts.path, part_file.write,
+                           blocksize=BLOCK_SIZE, rest=offset or None)
+    finally:
+        ftp.close()
+    _check_size(part_path, size)
+
+
+def _download_http(url, part_path):
+    offset = _get_size(part_path)
+    request = urllib.request.Request(url)
+    if offset:
+        request.add_header('Range', 'bytes={}-'.format(offset))
+    try:
+        response = urllib.request.urlopen(request, timeout=TIMEOUT)
+    except urllib.error.HTTPError as e:
+        # Nothing left past offset: the part file is complete
+        if offset and e.code == 416:
+            return
+        raise
+    with response:
+        # A server that ignores Range sends the whole file again
+        resumed = offset and response.status == 206
+        size = _get_expected_size(response, offset if resumed else 0)
+        with open(part_path, 'ab' if resumed else 'wb') as part_file:
+            shutil.copyfileobj(response, part_file, BLOCK_SIZE)
+    _check_size(part_path, size)
+
+
+def _get_expected_size(response, offset):
+    '''Full size of the file being sent, or None if the server omits it.'''
+    content_range = response.headers.get('Content-Range', '')
+    # 'bytes first-last/size', size being '*' when unknown
+    total = content_range.rpartition('/')[2].strip()
+    if total.isdigit():
+        return int(total)
+    length = response.headers.get('Content-Length', '')
+    if length.strip().isdigit():
+        return offset + int(length)
+    return None
+
+
+def _check_size(part_path, size):
+    '''Raises IncompleteRead if part_path is shorter than size.'''
+    written = _get_size(part_path)
+    if size is not None and written < size:
+        raise http.client.IncompleteRead(b'', size - written)
+
+
+def _connect_ftp(parts):
+    ftp = ftplib.FTP(timeout=TIMEOUT)
+    ftp.connect(parts.hostname, parts.port or 21)
+    # An empty user logs in anonymously
+    ftp.login(parts.username or '', parts.password or '')
+    return ftp
+
+
+def _get_size(file_path):
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
+
+
+def _retry(function, *args):
+    '''Calls function, retrying network errors with a growing delay.'''
+    delay = RETRY_DELAY
+    for attempt in range(1, RETRIES + 1):
+        try:
+            return function(*args)
+        except RETRY_ERRORS as e:
+            # HTTPError is an OSError, so 404 or 403 lands here too
+            if is_permanent_error(e):
+                raise surgeo.SurgeoError('{} failed: {}'.format(args[0], e))
+            if attempt == RETRIES:
+                raise surgeo.SurgeoError('{} failed after {} attempts: {}'
+                                         .format(args[0], RETRIES, e))
+            time.sleep(delay)
+            delay *= 2
+
+
+def drop_bad_archives(verbose, paths):
+    '''Removes the archives among paths that fail their CRC check.
+
+    Args:
+        verbose: True/False for whether function outputs info.
+        paths: zip archive paths
+    Returns:
+        List of the paths removed
+    Raises:
+        None
+
+    Called when setup fails on downloaded archives, so that the next run
+    downloads a corrupt archive again instead of failing on it each time.
+    Every member of every archive is read, so this is not cheap.
+
+    '''
+
+    removed = []
+    for path in paths:
+        try:
+            with zipfile.ZipFile(path) as archive:
+                bad = archive.testzip() is not None
+        except (zipfile.BadZipFile, zlib.error, EOFError, OSError):
+            bad = True
+        if bad and os.path.exists(path):
+            os.remove(path)
+            removed.append(path)
+            if verbose is True:
+                sys.stdout.write('Removed corrupt archive {}\n'.format(path))
+    return removed
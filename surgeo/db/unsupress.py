@@ -1,17 +1,26 @@
 
-import decimal
 import os
 import sqlite3
-import sys
-import time
 import traceback
 
+import surgeo.db.db_build
+import surgeo.model.lookup
 
-def reconstitute_data():
+# build_manifest stage of the reconstitution
+RECONSTITUTE_STAGE = 'reconstitute'
+
+# surname_data columns after the v1 id, in table order. Named, not
+# positional, so that rows read the same in the v1 and v2 schema.
+SURNAME_COLUMNS = ('name', 'rank', 'count', 'prop1000K', 'cum_prop100K',
+                   'pctwhite', 'pctblack', 'pctapi', 'pctaian', 'pct2prace',
+                   'pcthispanic')
+
+
+def reconstitute_data(db_path=None):
     '''Go through each row. Fill in estimates for redacted items.
 
     Args:
-        None
+        db_path: database to update (default: ~/.surgeo/census.db)
     Returns:
         None
     Raises:
@@ -23,17 +32,36 @@ def reconstitute_data():
     then divide it equally between the scrubbed categories. This yields an
     approximation.
 
+    The changes are committed together with the 'reconstitute' stage in
+    build_manifest, and a database where that stage is done is left alone.
+    Rows are keyed by id in a v1 database and by name once it is migrated
+    to v2, which has no id column.
+
     '''
 
-    db_path = os.path.join(os.path.expanduser('~'),
-                           '.surgeo',
-                           'census.db')
+    if db_path is None:
+        db_path = os.path.join(os.path.expanduser('~'),
+                               '.surgeo',
+                               'census.db')
     redacted_db = sqlite3.connect(db_path)
+    if surgeo.db.db_build.get_completed_units(redacted_db,
+                                              RECONSTITUTE_STAGE):
+        redacted_db.close()
+        return
     try:
         cursor = redacted_db.cursor()
+        # Each row is read as its key followed by SURNAME_COLUMNS; the
+        # key is the v1 id, or the name itself in v2
+        if surgeo.model.lookup.get_schema_version(redacted_db) < 2:
+            key_column = 'id'
+            columns = ('id',) + SURNAME_COLUMNS
+        else:
+            key_column = 'name'
+            columns = SURNAME_COLUMNS
         altered_rows = []
-        for row in cursor.execute('''SELECT * FROM surname_data'''):
-            time.sleep(0)
+        for row in cursor.execute('''SELECT {}, {} FROM surname_data'''
+                                  .format(key_column,
+                                          ', '.join(SURNAME_COLUMNS))):
             primary_key = row[0]
             surname = row[1]
             rank = row[2]
@@ -71,15 +99,23 @@ def reconstitute_data():
             # All redacted items set the same and added to list of altered rows
             for redacted_item in redacted:
                 redacted_item = count_per_redacted_item
-            # Add altered row to altered_rows
-            altered_rows.append(row)
-        for row in altered_rows:
-            time.sleep(0)
-            primary_key = row[0]
-            cursor.execute('''DELETE FROM surname_data WHERE id=?''',
-                           (primary_key,))
-            cursor.execute('''INSERT INTO surname_data VALUES
-                              (?,?,?,?,?,?,?,?,?,?,?,?)''', row)
+            # Add altered row to altered_rows, without a v2 key repeated
+            altered_rows.append(row[len(row) - len(columns):])
+        cursor.executemany('''DELETE FROM surname_data WHERE {}=?'''
+                           .format(key_column),
+                           [(row[0],) for row in altered_rows])
+        cursor.executemany('''INSERT INTO surname_data({}) VALUES ({})'''
+                           .format(', '.join(columns),
+                                   ', '.join('?' * len(columns))),
+                           altered_rows)
+        # Only a build that keeps a manifest is checkpointed
+        if surgeo.db.db_build.has_manifest(redacted_db):
+            surgeo.db.db_build.mark_completed(cursor,
+                                              RECONSTITUTE_STAGE,
+                                              rows=len(altered_rows))
+        # Release the write lock for the next setup step
+        redacted_db.commit()
+        redacted_db.close()
         # Index via name to speed up searches
     except sqlite3.Error as e:
         traceback.print_exc()
@@ -6,7 +6,6 @@
 # Main
 ###############################################################################
 
-import argparse
 import sys
 
 import surgeo
@@ -17,16 +16,29 @@ def main(*args):
 
     Args:
         --setup: (0 args) downloads and creates database for model creation
+        --from-dir: (1 arg) directory of census archives used by --setup
+        --rebuild: (0 args) makes --setup start over instead of resuming
+        --migrate-db: (0 args) upgrades an existing database's schema
         --pipe: (0 args) takes stdin, processes, and sends to stdout
         --file: (2 args) takes 1. filepath input csv 2. filepath output csv
+        --jobs: (1 arg) number of processes used with --file or --setup
+        --engine: (1 arg) lookup engine: sqlite, memory, pack or shared
+        --format: (1 arg) --pipe output: text, tsv, csv or jsonl
         --simple: (2 args) takes zip and surname, returns text string
+        --serve: (0 args) serves JSON scoring requests until stopped
+        --host, --port: (1 arg each) HTTP address used with --serve
+        --socket: (1 arg) Unix socket path used with --serve instead
+        --batch-window: (1 arg) milliseconds --serve waits to batch requests
+        --max-batch: (1 arg) records at which --serve scores a batch
         --complex: (2 args) takes zip and surname, returns detailed string
     Returns:
         --setup: None
-        --pipe: long text string
+        --migrate-db: None
+        --pipe: long text string, or one tsv/csv/jsonl line per record
         --file: None (output to csv file)
         --simple: text string ('White')
         --complex: long text string
+        --serve: None (runs until interrupted)
     Raises:
         None
 
@@ -36,45 +48,52 @@ def main(*args):
     parsed_args = surgeo.utilities.get_parser_args()
 ##### Setup
     if parsed_args.setup:
-        surgeo.data_setup(verbose=True)
+        surgeo.data_setup(verbose=True,
+                          from_dir=parsed_args.from_dir,
+                          jobs=parsed_args.jobs,
+                          rebuild=parsed_args.rebuild)
+##### Migrate
+    if parsed_args.migrate_db:
+        surgeo.db.migrate_db(verbose=True)
 ##### Pipe
     if parsed_args.pipe:
-        model = surgeo.SurgeoModel()
-        try:
-            while True:
-                for line in sys.stdin:
-                    try:
-                        # Remove surrounding whitespace
-                        line.strip()
-                        zcta, surname = line.split()
-                        result = model.race_data(zcta, surname)
-                    except ValueError:
-                        result = model.race_data('00000', 'BAD_NAME')
-                    print(result.as_string)
-        except EOFError:
-            pass
+        # Pipe and server modules are imported only when used
+        from surgeo.utilities.pipe import run_pipe
+        model = surgeo.SurgeoModel(engine=parsed_args.engine)
+        run_pipe(model, sys.stdin, sys.stdout, parsed_args.format)
 ##### Simple
     elif parsed_args.simple:
-        model = surgeo.SurgeoModel()
+        model = surgeo.SurgeoModel(engine=parsed_args.engine)
         zcta = parsed_args.simple[0]
         surname = parsed_args.simple[1]
         race = model.guess_race(zcta, surname)
         print(race)
 ##### Complex
     elif parsed_args.complex:
-        model = surgeo.SurgeoModel()
+        model = surgeo.SurgeoModel(engine=parsed_args.engine)
         zcta = parsed_args.complex[0]
         surname = parsed_args.complex[1]
         result = model.race_data(zcta, surname)
         print(result.as_string)
 ##### File
     elif parsed_args.file:
-        model = surgeo.SurgeoModel()
+        model = surgeo.SurgeoModel(engine=parsed_args.engine)
         infile = parsed_args.file[0]
         outfile = parsed_args.file[1]
-        model.process_csv(infile, outfile)
+        model.process_csv(infile, outfile, workers=parsed_args.jobs)
+##### Serve
+    elif parsed_args.serve:
+        from surgeo.utilities.server import serve
+        serve(parsed_args.host,
+              parsed_args.port,
+              parsed_args.socket,
+              engine=parsed_args.engine,
+              batch_window=parsed_args.batch_window / 1000,
+              max_batch=parsed_args.max_batch)
     elif not any([parsed_args.setup,
+                  parsed_args.migrate_db,
                   parsed_args.pipe,
+                  parsed_args.serve,
                   parsed_args.simple,
                   parsed_args.complex,
                   parsed_args.file]):
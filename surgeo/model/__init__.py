@@ -1,2 +1,9 @@
-
 import surgeo.model.model1
+import surgeo.model.model2
+import surgeo.model.lookup
+import surgeo.model.connection
+import surgeo.model.engine
+import surgeo.model.cache
+import surgeo.model.batch
+
+from surgeo.model.batch import run_model_batch
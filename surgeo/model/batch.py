@@ -0,0 +1,173 @@
+'''This is the batch model. It scores many records in one call.
+
+   Records are deduplicated, and surname vectors p(i|j) and zcta vectors
+   r(k|i) are fetched once per distinct key. Each distinct key is then
+   scored row by row, in plain Python, and copied to every record with
+   that key:
+
+                                    p(i|j) * r(k|i)
+   q(i|j,k) = ---------------------------------------------------
+              sum of p(i|j) * r(k|i) over all six races i
+
+   Results are returned in columnar form. Probabilities are a flat
+   array.array('d') holding an N x 6 matrix in row-major order (race order
+   as in surgeo.model.model1.races) and race codes are an array.array('b')
+   holding the argmax race (1-6) for each record, or 0 if the record could
+   not be scored. Rows that could not be scored are all zeros.
+
+'''
+
+import array
+
+import surgeo
+import surgeo.model.engine
+
+# Returned for records that cannot be scored
+ERROR_CODE = 0
+
+_ERROR_ROW = (0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+
+
+def run_model_batch(zctas, surnames, db, summary=None):
+    '''Takes zctas and surnames. Returns probabilities and race codes.
+
+    Args:
+        zctas: sequence of zcta text, or None for a surname only model
+        surnames: sequence of surname text, or None for a geocode only model
+        db: Sqlite3 database connection instance or engine instance
+        summary: optional BatchSummary that record counts are added to
+    Returns:
+        (probabilities, race_codes): array.array('d') of length 6 * N and
+        array.array('b') of length N
+    Raises:
+        SurgeoError: if zctas and surnames are both None or differ in length
+
+    This is deduplicated per-row scoring, not vectorized arithmetic.
+    Records are deduplicated first. Each distinct (zcta, surname) pair is
+    looked up and scored once, one row at a time, and its result is
+    copied back to every record with that pair, in the original order.
+
+    '''
+
+    if zctas is None and surnames is None:
+        raise surgeo.SurgeoError('Batch requires zctas, surnames, or both.')
+    if zctas is not None:
+        zctas = [str(zcta) for zcta in zctas]
+    if surnames is not None:
+        surnames = [surname.upper() for surname in surnames]
+    if (zctas is not None and surnames is not None and
+            len(zctas) != len(surnames)):
+        raise surgeo.SurgeoError('Batch zctas and surnames differ in length.')
+    if zctas is None:
+        keys = surnames
+    elif surnames is None:
+        keys = zctas
+    else:
+        keys = list(zip(zctas, surnames))
+    unique_keys, inverse = index_unique(keys)
+    if summary is not None:
+        summary.add(len(keys), len(unique_keys))
+    engine = surgeo.model.engine.get_engine(db)
+    # Each distinct key is looked up exactly once.
+    if zctas is None:
+        surname_vectors = engine.surname_vectors(unique_keys)
+        rows = [surname_vectors[surname] for surname in unique_keys]
+    elif surnames is None:
+        zcta_vectors = engine.zcta_vectors(unique_keys)
+        rows = [zcta_vectors[zcta] for zcta in unique_keys]
+    else:
+        zcta_vectors = engine.zcta_vectors(
+            [zcta for zcta, surname in unique_keys])
+        surname_vectors = engine.surname_vectors(
+            [surname for zcta, surname in unique_keys])
+        rows = [combine_vectors(zcta_vectors[zcta], surname_vectors[surname])
+                for zcta, surname in unique_keys]
+    # Score distinct keys, then scatter back to record order.
+    unique_codes = []
+    for index, row in enumerate(rows):
+        if row is None:
+            rows[index] = _ERROR_ROW
+            unique_codes.append(ERROR_CODE)
+        else:
+            unique_codes.append(argmax_race(row))
+    probabilities = array.array('d')
+    race_codes = array.array('b')
+    for position in inverse:
+        probabilities.extend(rows[position])
+        race_codes.append(unique_codes[position])
+    return probabilities, race_codes
+
+
+def index_unique(keys):
+    '''Returns (unique_keys, inverse) where keys[n] is unique_keys[inverse[n]].
+
+    Args:
+        keys: sequence of hashable keys
+    Returns:
+        (unique_keys, inverse): list in first seen order, array.array('l')
+    Raises:
+        None
+
+    '''
+
+    positions = {}
+    unique_keys = []
+    inverse = array.array('l')
+    for key in keys:
+        position = positions.get(key)
+        if position is None:
+            position = len(unique_keys)
+            positions[key] = position
+            unique_keys.append(key)
+        inverse.append(position)
+    return unique_keys, inverse
+
+
+class BatchSummary(object):
+    '''Counts records and distinct keys across one or more batches.
+
+    Attributes:
+        self.records: number of records scored
+        self.unique: number of distinct keys actually scored
+        self.dedup_ratio: @property float, records per distinct key
+
+    '''
+
+    def __init__(self):
+        self.records = 0
+        self.unique = 0
+
+    def add(self, records, unique):
+        self.records += records
+        self.unique += unique
+
+    @property
+    def dedup_ratio(self):
+        if self.unique == 0:
+            return 1.0
+        return self.records / self.unique
+
+    def __str__(self):
+        return ('{} records, {} distinct, dedup ratio {:.2f}'
+                .format(self.records, self.unique, self.dedup_ratio))
+
+
+def combine_vectors(zcta_vector, surname_vector):
+    '''Combines r(k|i) and p(i|j) into q(i|j,k). None if not possible.'''
+    if zcta_vector is None or surname_vector is None:
+        return None
+    combined = [zcta_prob * surname_prob for zcta_prob, surname_prob in
+                zip(zcta_vector, surname_vector)]
+    total = sum(combined)
+    if total == 0:
+        return None
+    return tuple(prob / total for prob in combined)
+
+
+def argmax_race(row):
+    '''Returns race code (1-6) of the largest probability. Ties go first.'''
+    best = 0
+    for index in range(1, 6):
+        if row[index] > row[best]:
+            best = index
+    return best + 1
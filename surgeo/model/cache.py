@@ -0,0 +1,172 @@
+'''Bounded LRU cache of surname and zcta probability vectors.
+
+   Real portfolios are skewed: a few thousand surnames and zip codes cover
+   most records. The cache keeps the most recently used vectors (including
+   misses, stored as None) so that repeats never reach the database. One
+   cache is shared by every model pointed at the same database.
+
+'''
+
+import collections
+import os
+import threading
+
+CacheInfo = collections.namedtuple('CacheInfo', ['hits',
+                                                 'misses',
+                                                 'evictions',
+                                                 'maxsize',
+                                                 'currsize'])
+
+# Used when a model is created with the default cache_size of None
+DEFAULT_MAXSIZE = 65536
+
+_shared_caches = {}
+_shared_caches_lock = threading.Lock()
+
+
+def get_shared_cache(db_path, maxsize, version=None):
+    '''Returns the VectorCache for db_path, creating it if needed.
+
+    Args:
+        db_path: file path of the database the cached vectors come from
+        maxsize: maximum number of vectors held
+        version: (st_dev, st_ino, st_mtime_ns) of the file the vectors
+            come from (default: db_path's current file)
+    Returns:
+        VectorCache instance shared by all callers with the same arguments
+    Raises:
+        OSError: if version is None and db_path does not exist
+
+    Keying on the file's version keeps models still reading a database
+    that setup has since replaced from sharing vectors with models on the
+    new one.
+
+    '''
+
+    if version is None:
+        stat = os.stat(db_path)
+        version = (stat.st_dev, stat.st_ino, stat.st_mtime_ns)
+    real_path = os.path.realpath(db_path)
+    key = (real_path, version, maxsize)
+    with _shared_caches_lock:
+        if key not in _shared_caches:
+            # Caches of a replaced file stay with the models using them
+            for old_key in list(_shared_caches):
+                if old_key[0] == real_path and old_key[1] != version:
+                    del _shared_caches[old_key]
+            _shared_caches[key] = VectorCache(maxsize)
+        return _shared_caches[key]
+
+
+def get_cache_info(cache):
+    '''Returns cache.info(), or all zeros if cache is None.'''
+    if cache is None:
+        return CacheInfo(0, 0, 0, 0, 0)
+    return cache.info()
+
+
+class VectorCache(object):
+    '''Least recently used cache with hit, miss and eviction counters.
+
+    Attributes:
+        self.maxsize: maximum number of entries
+        self.hits: lookups answered from the cache
+        self.misses: lookups passed through to the engine
+        self.evictions: entries dropped to make room
+
+    '''
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        '''Returns (True, vector) on a hit and (False, None) on a miss.'''
+        with self._lock:
+            try:
+                vector = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, vector
+
+    def put(self, key, vector):
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        '''Empties the cache and resets the counters.'''
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def info(self):
+        with self._lock:
+            return CacheInfo(self.hits,
+                             self.misses,
+                             self.evictions,
+                             self.maxsize,
+                             len(self._entries))
+
+
+class CachedEngine(object):
+    '''Engine wrapper that consults a VectorCache before the engine.
+
+    Attributes:
+        self.engine: the wrapped engine
+        self.cache: VectorCache instance, possibly shared
+
+    '''
+
+    def __init__(self, engine, cache):
+        self.engine = engine
+        self.cache = cache
+
+    def surname_vector(self, surname):
+        return self._vector('surname', surname, self.engine.surname_vector)
+
+    def zcta_vector(self, zcta):
+        return self._vector('zcta', str(zcta), self.engine.zcta_vector)
+
+    def surname_vectors(self, surnames):
+        return self._vectors('surname', surnames,
+                             self.engine.surname_vectors)
+
+    def zcta_vectors(self, zctas):
+        return self._vectors('zcta', [str(zcta) for zcta in zctas],
+                             self.engine.zcta_vectors)
+
+    def _vector(self, kind, key, fetch):
+        hit, vector = self.cache.get((kind, key))
+        if not hit:
+            vector = fetch(key)
+            self.cache.put((kind, key), vector)
+        return vector
+
+    def _vectors(self, kind, keys, fetch):
+        vectors = {}
+        missing = []
+        for key in set(keys):
+            hit, vector = self.cache.get((kind, key))
+            if hit:
+                vectors[key] = vector
+            else:
+                missing.append(key)
+        if missing:
+            fetched = fetch(missing)
+            for key in missing:
+                self.cache.put((kind, key), fetched[key])
+            vectors.update(fetched)
+        return vectors
@@ -0,0 +1,273 @@
+'''Per-thread, read-only connections to census.db for the models.
+
+   sqlite3 connections may not be shared between threads, so a model that
+   held one connection could only be used by the thread that built it.
+   A ConnectionManager stands in for that connection: cursor() and
+   execute() go to a connection of the calling thread's own, opened on
+   first use. Connections are read-only and immutable, and are tuned for
+   reads with READ_PRAGMAS.
+
+   setup publishes a new census.db by renaming it over the old one. So
+   that one model never mixes rows of two builds, a manager pins the file
+   it was created on: it hard links it to census.db.pin-<dev>-<ino> and
+   holds a shared flock on the link for as long as it lives, and every
+   connection it opens, in any thread, goes through the link. A model
+   keeps scoring from the build it started on; a new model uses the new
+   one. Pins no model holds are removed by sweep_pins. Where hard links
+   or flock are unavailable, a manager reads census.db itself and raises
+   SurgeoError rather than open a connection on a replaced file.'''
+
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+import weakref
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: no flock, so files are not pinned
+    fcntl = None
+
+import surgeo
+
+# PRAGMAs run on every new read connection. mmap_size maps up to 256 MB of
+# the file instead of copying pages, cache_size (negative = KiB) keeps 64
+# MB of pages, and temp_store keeps sorts and temporary b-trees in memory.
+READ_PRAGMAS = (('mmap_size', 268435456),
+                ('cache_size', -65536),
+                ('query_only', 'ON'),
+                ('temp_store', 'MEMORY'))
+
+# Attempts to open census.db, and seconds between them. setup replaces the
+# file with a rename; on some platforms an open that races it fails.
+OPEN_ATTEMPTS = 3
+OPEN_RETRY_DELAY = 0.1
+
+# A pin of census.db is census.db + PIN_SUFFIX + '<st_dev>-<st_ino>'
+PIN_SUFFIX = '.pin-'
+
+
+def get_file_identity(db_path):
+    '''Returns (st_dev, st_ino), which a file keeps until it is replaced.'''
+    stat = os.stat(db_path)
+    return stat.st_dev, stat.st_ino
+
+
+def pin_file(db_path):
+    '''Pins the file at db_path so it outlives being replaced.
+
+    Args:
+        db_path: file path of an existing database
+    Returns:
+        (read_path, fd, stat): path to open the pinned file by, the file
+        descriptor holding the shared flock (None if the file could not be
+        pinned, read_path then being db_path) and the file's os.stat_result
+    Raises:
+        OSError: if db_path does not exist
+
+    Close fd (see unpin_file) to release the pin.
+
+    '''
+
+    if fcntl is None:
+        return db_path, None, os.stat(db_path)
+    for attempt in range(OPEN_ATTEMPTS):
+        stat = os.stat(db_path)
+        pin_path = '{}{}{}-{}'.format(db_path, PIN_SUFFIX, stat.st_dev,
+                                      stat.st_ino)
+        try:
+            os.link(db_path, pin_path)
+        except FileExistsError:
+            pass
+        except OSError:
+            # No hard links on this file system, or no permission
+            return db_path, None, stat
+        try:
+            fd = os.open(pin_path, os.O_RDONLY)
+        except FileNotFoundError:
+            # Swept between the link and the open
+            continue
+        fcntl.flock(fd, fcntl.LOCK_SH)
+        # Once locked a pin is not swept; check it is still the file
+        pinned = os.fstat(fd)
+        if (_get_identity(pin_path) == (pinned.st_dev, pinned.st_ino) ==
+                (stat.st_dev, stat.st_ino)):
+            return pin_path, fd, pinned
+        os.close(fd)
+    return db_path, None, os.stat(db_path)
+
+
+def unpin_file(fd, db_path):
+    '''Releases a pin taken by pin_file and sweeps pins no longer held.'''
+    if fd is not None:
+        os.close(fd)
+        sweep_pins(db_path)
+
+
+def sweep_pins(db_path):
+    '''Removes the pins of db_path that no manager holds.
+
+    Args:
+        db_path: file path of the database
+    Returns:
+        None
+    Raises:
+        None
+
+    A pin of the file now at db_path is kept; it costs no space.
+
+    '''
+
+    if fcntl is None:
+        return
+    current = _get_identity(db_path)
+    dir_path, name = os.path.split(os.path.abspath(db_path))
+    try:
+        file_names = os.listdir(dir_path)
+    except OSError:
+        return
+    for file_name in file_names:
+        if not file_name.startswith(name + PIN_SUFFIX):
+            continue
+        pin_path = os.path.join(dir_path, file_name)
+        try:
+            fd = os.open(pin_path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            stat = os.fstat(fd)
+            identity = (stat.st_dev, stat.st_ino)
+            if identity == current:
+                continue
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                # Held by a manager
+                continue
+            if _get_identity(pin_path) == identity:
+                os.remove(pin_path)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+
+def _get_identity(path):
+    try:
+        return get_file_identity(path)
+    except OSError:
+        return None
+
+
+def connect_read_only(db_path):
+    '''Opens a tuned, read-only, immutable connection to db_path.
+
+    Args:
+        db_path: file path of an existing sqlite database
+    Returns:
+        Sqlite3 database connection instance
+    Raises:
+        sqlite3.OperationalError: if the file still cannot be opened after
+            OPEN_ATTEMPTS tries
+
+    immutable=1 tells sqlite the file will not change while it is open, so
+    it skips locking and change detection. setup never changes census.db
+    in place: it replaces the file, which open connections do not see.
+    (--migrate-db does change it in place; run it while nothing scores.)
+
+    '''
+
+    uri = 'file:{}?mode=ro&immutable=1'.format(urllib.parse.quote(
+        os.path.abspath(db_path).replace(os.sep, '/')))
+    for attempt in range(1, OPEN_ATTEMPTS + 1):
+        try:
+            # Only the creating thread uses it, but the manager may close it
+            connection = sqlite3.connect(uri, uri=True,
+                                         check_same_thread=False)
+            # Reads the header, so a file that cannot be read fails here
+            connection.execute('PRAGMA schema_version')
+            break
+        except sqlite3.OperationalError:
+            if attempt == OPEN_ATTEMPTS:
+                raise
+            time.sleep(OPEN_RETRY_DELAY)
+    for pragma, value in READ_PRAGMAS:
+        connection.execute('PRAGMA {}={}'.format(pragma, value))
+    return connection
+
+
+class ConnectionManager(object):
+    '''Hands each thread its own read-only connection to one database.
+
+    Attributes:
+        self.db_path: file path of the database
+        self.read_path: path connections are opened on (the pin, see the
+            module docstring, or db_path)
+        self.identity: (st_dev, st_ino) of the file read
+        self.version: identity plus st_mtime_ns, which tells builds apart
+            even if a file system reuses an inode
+    Methods:
+        connection: returns the calling thread's connection.
+        cursor: returns a cursor on the calling thread's connection.
+        execute: runs a statement on the calling thread's connection.
+        close: closes every connection the manager has opened.
+
+    A manager can be passed anywhere a Sqlite3 connection is read from
+    (the lookup functions, engines and model2.run_model). Connections of
+    threads that have exited are closed when the next one is opened.
+    Every connection reads the file db_path held when the manager was
+    created, even after setup replaces it.
+
+    '''
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.read_path, pin_fd, stat = pin_file(db_path)
+        self.identity = (stat.st_dev, stat.st_ino)
+        self.version = self.identity + (stat.st_mtime_ns,)
+        self._finalizer = weakref.finalize(self, unpin_file, pin_fd,
+                                           db_path)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def connection(self):
+        '''Returns the calling thread's connection, opening it if needed.'''
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = connect_read_only(self.read_path)
+            # Checked after the open, so the file opened is the one checked
+            if _get_identity(self.read_path) != self.identity:
+                connection.close()
+                raise surgeo.SurgeoError('{} was replaced since the model '
+                                         'was created. Create the model '
+                                         'again to use the new database.'
+                                         .format(self.db_path))
+            self._local.connection = connection
+            with self._lock:
+                finished = [(thread, old) for thread, old in
+                            self._connections if not thread.is_alive()]
+                self._connections = [(thread, old) for thread, old in
+                                     self._connections if thread.is_alive()]
+                self._connections.append((threading.current_thread(),
+                                          connection))
+            for _, old in finished:
+                old.close()
+        return connection
+
+    def cursor(self):
+        return self.connection().cursor()
+
+    def execute(self, *args):
+        return self.connection().execute(*args)
+
+    def close(self):
+        '''Closes every connection opened so far, in any thread.'''
+        with self._lock:
+            connections = self._connections
+            self._connections = []
+        for _, connection in connections:
+            connection.close()
+        self._local = threading.local()
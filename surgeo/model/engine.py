@@ -0,0 +1,203 @@
+'''Lookup engines. These hand probability vectors to the models.
+
+   Every engine has the same four methods:
+
+       surname_vector(surname) -> vector or None
+       zcta_vector(zcta) -> vector or None
+       surname_vectors(surnames) -> {surname: vector or None}
+       zcta_vectors(zctas) -> {zcta: vector or None}
+
+   Vectors are six floats ordered like surgeo.model.model1.races. The
+   'sqlite' engine queries census.db for every lookup. The 'memory' engine
+   reads census.db once and answers lookups from contiguous arrays. The
+   'pack' engine answers lookups from a memory-mapped pack file built from
+   census.db (see surgeo.model.pack). The 'shared' engine reads the same
+   layout from a shared memory block that worker processes attach to (see
+   surgeo.model.shared).
+
+'''
+
+import array
+import os
+
+import surgeo
+import surgeo.model.cache
+import surgeo.model.connection
+import surgeo.model.lookup
+
+ENGINES = ('sqlite', 'memory', 'pack', 'shared')
+
+# Engines slow enough per lookup that models put a VectorCache in front
+CACHED_ENGINES = ('sqlite',)
+
+
+def create_engine(name, db):
+    '''Creates an engine by name on top of a database connection.
+
+    Args:
+        name: one of ENGINES
+        db: Sqlite3 database connection instance
+    Returns:
+        engine instance
+    Raises:
+        SurgeoError: if the engine name is unknown
+
+    '''
+
+    if name == 'sqlite':
+        return SqliteEngine(db)
+    if name == 'memory':
+        return MemoryEngine(db)
+    # Imported here so plain sqlite scoring does not load mmap or
+    # multiprocessing.shared_memory
+    if name == 'pack':
+        from surgeo.model.pack import open_pack
+        return PackEngine(open_pack(db))
+    if name == 'shared':
+        from surgeo.model.shared import open_shared
+        return PackEngine(open_shared(db))
+    raise surgeo.SurgeoError('Unknown engine \'{}\'. Choose from {}.'
+                             .format(name, ', '.join(ENGINES)))
+
+
+def open_engine(db_path, name='sqlite', cache_size=None):
+    '''Opens db_path and returns what a model scores with.
+
+    Args:
+        db_path: file path of census.db
+        name: one of ENGINES
+        cache_size: vectors held in a VectorCache shared by every model on
+            db_path; None means DEFAULT_MAXSIZE for CACHED_ENGINES and no
+            cache for the others, 0 means no cache
+    Returns:
+        (db, engine, cache): ConnectionManager for db_path, engine (wrapped
+        in a CachedEngine if cached) and the VectorCache or None
+    Raises:
+        SurgeoError: if db_path does not exist or the engine is unknown
+
+    '''
+
+    if not os.path.exists(db_path):
+        raise surgeo.SurgeoError('DB does not exist. Run surgeo.data'
+                                 '_setup() or run program with '
+                                 '\'--setup\' option.')
+    db = surgeo.model.connection.ConnectionManager(db_path)
+    engine = create_engine(name, db)
+    if cache_size is None:
+        cache_size = surgeo.model.cache.DEFAULT_MAXSIZE
+        if name not in CACHED_ENGINES:
+            cache_size = 0
+    if not cache_size:
+        return db, engine, None
+    cache = surgeo.model.cache.get_shared_cache(db_path, cache_size,
+                                                db.version)
+    return db, surgeo.model.cache.CachedEngine(engine, cache), cache
+
+
+def get_engine(db):
+    '''Returns db if it is already an engine, else a SqliteEngine for it.'''
+    if hasattr(db, 'surname_vectors'):
+        return db
+    return SqliteEngine(db)
+
+
+class SqliteEngine(object):
+    '''Looks up each vector in census.db with a query.
+
+    Attributes:
+        self.db: Sqlite3 database connection instance
+
+    '''
+
+    def __init__(self, db):
+        self.db = db
+
+    def surname_vector(self, surname):
+        return surgeo.model.lookup.get_surname_vector(surname, self.db)
+
+    def zcta_vector(self, zcta):
+        return surgeo.model.lookup.get_zcta_vector(zcta, self.db)
+
+    def surname_vectors(self, surnames):
+        return surgeo.model.lookup.get_surname_vectors(surnames, self.db)
+
+    def zcta_vectors(self, zctas):
+        return surgeo.model.lookup.get_zcta_vectors(zctas, self.db)
+
+
+class MemoryEngine(object):
+    '''Holds every vector in memory. A lookup is a dict probe and a slice.
+
+    Attributes:
+        self.surname_index: dict of surname: row number (None if unusable)
+        self.surname_probs: array.array('d'), six floats per row
+        self.zcta_index: dict of zcta: row number (None if unusable)
+        self.zcta_probs: array.array('d'), six floats per row
+
+    '''
+
+    def __init__(self, db):
+        self.surname_index, self.surname_probs = self._load(
+            surgeo.model.lookup.iter_surname_vectors(db))
+        self.zcta_index, self.zcta_probs = self._load(
+            surgeo.model.lookup.iter_zcta_vectors(db))
+
+    @staticmethod
+    def _load(pairs):
+        index = {}
+        probs = array.array('d')
+        for key, vector in pairs:
+            # First row for a key wins, as with a database lookup
+            if key in index:
+                continue
+            if vector is None:
+                index[key] = None
+                continue
+            index[key] = len(probs) // 6
+            probs.extend(vector)
+        return index, probs
+
+    def surname_vector(self, surname):
+        row = self.surname_index.get(surname)
+        if row is None:
+            return None
+        return tuple(self.surname_probs[row * 6:row * 6 + 6])
+
+    def zcta_vector(self, zcta):
+        row = self.zcta_index.get(str(zcta))
+        if row is None:
+            return None
+        return tuple(self.zcta_probs[row * 6:row * 6 + 6])
+
+    def surname_vectors(self, surnames):
+        return {surname: self.surname_vector(surname)
+                for surname in set(surnames)}
+
+    def zcta_vectors(self, zctas):
+        return {zcta: self.zcta_vector(zcta) for zcta in set(zctas)}
+
+
+class PackEngine(object):
+    '''Looks up vectors in a memory-mapped pack. No SQL, no load step.
+
+    Attributes:
+        self.pack: open surgeo.model.pack.Pack (or shared.SharedPack)
+
+    '''
+
+    def __init__(self, pack):
+        self.pack = pack
+
+    def surname_vector(self, surname):
+        return self.pack.surnames.vector(surname)
+
+    def zcta_vector(self, zcta):
+        return self.pack.zctas.vector(str(zcta))
+
+    def surname_vectors(self, surnames):
+        vector = self.pack.surnames.vector
+        return {surname: vector(surname) for surname in set(surnames)}
+
+    def zcta_vectors(self, zctas):
+        vector = self.pack.zctas.vector
+        return {zcta: vector(str(zcta)) for zcta in set(zctas)}
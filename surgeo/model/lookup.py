@@ -0,0 +1,232 @@
+'''Fetches the probability vectors used by the model.
+
+   A surname vector is p(i|j) for i in 1..6 and a zcta vector is r(k|i) for
+   i in 1..6, both ordered like surgeo.model.model1.races (Hispanic, White,
+   Black, Asian or Pacific Islander, American Indian / Alaska Native,
+   Multiracial). A key that is missing or unusable yields None.
+
+'''
+
+import sqlite3
+
+# Keys per IN (...) query. Below SQLite's historical 999 parameter limit.
+IN_CHUNK_SIZE = 500
+
+# Column that orders rows so the first row for a key wins, by schema
+# version. In schema v2 keys are unique, so the order is only for
+# stability.
+_SURNAME_ORDER = {1: 'id', 2: 'name'}
+_RACE_ORDER = {1: 'r.id', 2: 'g.id'}
+
+
+def get_schema_version(db):
+    '''Returns the census.db schema version: 2 once migrated, else 1.'''
+    version = db.execute('PRAGMA user_version').fetchone()[0]
+    return version if version >= 2 else 1
+
+
+def get_surname_vector(surname, db):
+    '''This gets all six surname probabilities p(i|j) in one query.
+
+    Args:
+        surname: text (upper case, as stored in surname_data)
+        db: Sqlite3 database connection instance
+    Returns:
+        tuple of six floats, or None if the surname cannot be scored
+    Raises:
+        None
+
+    '''
+
+    cursor = db.cursor()
+    cursor.execute('''SELECT pcthispanic, pctwhite, pctblack, pctapi,
+                      pctaian, pct2prace FROM surname_data WHERE name=?''',
+                   (surname,))
+    return surname_vector_from_row(cursor.fetchone())
+
+
+def get_zcta_vector(zcta, db):
+    '''This gets all six zcta probabilities r(k|i) in one query.
+
+    Args:
+        zcta: text
+        db: Sqlite3 database connection instance
+    Returns:
+        tuple of six floats, or None if the zcta cannot be scored
+    Raises:
+        None
+
+    Like model1, only the first geocode_data row for a zcta is considered.
+    Uses the precomputed zcta_race_prob table when the database has one.
+
+    '''
+
+    cursor = db.cursor()
+    try:
+        cursor.execute('''SELECT prob_hispanic, prob_white, prob_black,
+                          prob_api, prob_ai, prob_multi FROM zcta_race_prob
+                          WHERE zcta=?''', (zcta,))
+        return cursor.fetchone()
+    except sqlite3.OperationalError:
+        # Databases built before zcta_race_prob existed
+        pass
+    cursor.execute('''SELECT r.num_hispanic, r.num_white, r.num_black,
+                      r.num_api, r.num_ai, r.num_multi FROM
+                      (SELECT state, logical_record FROM geocode_data
+                       WHERE zcta=? LIMIT 1) AS g
+                      JOIN logical_race_data AS r
+                      ON r.logical_record=g.logical_record
+                      AND r.state=g.state LIMIT 1''',
+                   (zcta,))
+    return zcta_vector_from_row(cursor.fetchone())
+
+
+def get_surname_vectors(surnames, db):
+    '''Gets surname vectors for many names with chunked IN (...) queries.
+
+    Args:
+        surnames: iterable of text (upper case)
+        db: Sqlite3 database connection instance
+    Returns:
+        dict of surname: vector (None for names that cannot be scored)
+    Raises:
+        None
+
+    Distinct names are fetched IN_CHUNK_SIZE at a time. As with
+    get_surname_vector, the first row (lowest id) for a name wins.
+
+    '''
+
+    vectors = dict.fromkeys(surnames)
+    order = _SURNAME_ORDER[get_schema_version(db)]
+    cursor = db.cursor()
+    for chunk in _iter_key_chunks(list(vectors)):
+        cursor.execute('''SELECT name, pcthispanic, pctwhite, pctblack,
+                          pctapi, pctaian, pct2prace FROM surname_data
+                          WHERE name IN ({}) ORDER BY {}'''.format(
+                              _placeholders(chunk), order), chunk)
+        found = set()
+        for row in cursor:
+            if row[0] not in found:
+                found.add(row[0])
+                vectors[row[0]] = surname_vector_from_row(row[1:])
+    return vectors
+
+
+def get_zcta_vectors(zctas, db):
+    '''Gets zcta vectors for many zctas with chunked IN (...) queries.
+
+    Args:
+        zctas: iterable of text (or int)
+        db: Sqlite3 database connection instance
+    Returns:
+        dict of zcta: vector (None for zctas that cannot be scored)
+    Raises:
+        None
+
+    Distinct zctas are fetched IN_CHUNK_SIZE at a time, with the same
+    first-row rules as get_zcta_vector.
+
+    '''
+
+    vectors = dict.fromkeys(zctas)
+    # Keys are compared as text, as the zcta column does for parameters
+    keys_by_text = {}
+    for zcta in vectors:
+        keys_by_text.setdefault(str(zcta), []).append(zcta)
+    cursor = db.cursor()
+    try:
+        for chunk in _iter_key_chunks(list(keys_by_text)):
+            cursor.execute('''SELECT zcta, prob_hispanic, prob_white,
+                              prob_black, prob_api, prob_ai, prob_multi
+                              FROM zcta_race_prob WHERE zcta IN ({})'''
+                           .format(_placeholders(chunk)), chunk)
+            for row in cursor:
+                for zcta in keys_by_text[row[0]]:
+                    vectors[zcta] = tuple(row[1:])
+        return vectors
+    except sqlite3.OperationalError:
+        # Databases built before zcta_race_prob existed
+        pass
+    order = _RACE_ORDER[get_schema_version(db)]
+    for chunk in _iter_key_chunks(list(keys_by_text)):
+        cursor.execute('''SELECT g.zcta, r.num_hispanic, r.num_white,
+                          r.num_black, r.num_api, r.num_ai, r.num_multi
+                          FROM geocode_data AS g
+                          LEFT JOIN logical_race_data AS r
+                          ON r.logical_record=g.logical_record
+                          AND r.state=g.state
+                          WHERE g.zcta IN ({}) ORDER BY g.id, {}'''
+                       .format(_placeholders(chunk), order), chunk)
+        found = set()
+        for row in cursor:
+            if row[0] not in found:
+                found.add(row[0])
+                vector = zcta_vector_from_row(row[1:])
+                for zcta in keys_by_text[row[0]]:
+                    vectors[zcta] = vector
+    return vectors
+
+
+def _iter_key_chunks(keys):
+    '''Yields lists of up to IN_CHUNK_SIZE keys.'''
+    for start in range(0, len(keys), IN_CHUNK_SIZE):
+        yield keys[start:start + IN_CHUNK_SIZE]
+
+
+def _placeholders(chunk):
+    return ', '.join('?' * len(chunk))
+
+
+def surname_vector_from_row(row):
+    '''Turns a surname_data percentage row into a probability vector.'''
+    if row is None:
+        return None
+    # csv in percentage form. Redacted '(S)' entries are not scored.
+    try:
+        return tuple(percentage / 100 for percentage in row)
+    except TypeError:
+        return None
+
+
+def zcta_vector_from_row(row):
+    '''Turns a logical_race_data count row into a probability vector.'''
+    if row is None:
+        return None
+    try:
+        total = sum(row)
+        return tuple(count / total for count in row)
+    except (TypeError, ZeroDivisionError):
+        return None
+
+
+def iter_surname_vectors(db):
+    '''Yields (surname, vector) for every surname_data row, in key order.'''
+    cursor = db.cursor()
+    cursor.execute('''SELECT name, pcthispanic, pctwhite, pctblack, pctapi,
+                      pctaian, pct2prace FROM surname_data ORDER BY {}'''
+                   .format(_SURNAME_ORDER[get_schema_version(db)]))
+    for row in cursor:
+        yield row[0], surname_vector_from_row(row[1:])
+
+
+def iter_zcta_vectors(db):
+    '''Yields (zcta, vector) for every zcta, first geocode row first.'''
+    cursor = db.cursor()
+    try:
+        cursor.execute('''SELECT zcta, prob_hispanic, prob_white, prob_black,
+                          prob_api, prob_ai, prob_multi FROM zcta_race_prob''')
+        for row in cursor:
+            yield row[0], tuple(row[1:])
+        return
+    except sqlite3.OperationalError:
+        # Databases built before zcta_race_prob existed
+        pass
+    cursor.execute('''SELECT g.zcta, r.num_hispanic, r.num_white, r.num_black,
+                      r.num_api, r.num_ai, r.num_multi FROM geocode_data AS g
+                      LEFT JOIN logical_race_data AS r
+                      ON r.logical_record=g.logical_record
+                      AND r.state=g.state ORDER BY g.id, {}'''
+                   .format(_RACE_ORDER[get_schema_version(db)]))
+    for row in cursor:
+        yield row[0], zcta_vector_from_row(row[1:])
@@ -81,12 +81,12 @@ def run_model(zcta, surname, db):
                      prob_multi)
     return surgeo.SurgeoResult(surname,
                                zcta,
-                               '{0:f}'.format(prob_hispanic/prob_combined),
-                               '{0:f}'.format(prob_white/prob_combined),
-                               '{0:f}'.format(prob_black/prob_combined),
-                               '{0:f}'.format(prob_api/prob_combined),
-                               '{0:f}'.format(prob_ai/prob_combined),
-                               '{0:f}'.format(prob_multi/prob_combined))
+                               prob_hispanic/prob_combined,
+                               prob_white/prob_combined,
+                               prob_black/prob_combined,
+                               prob_api/prob_combined,
+                               prob_ai/prob_combined,
+                               prob_multi/prob_combined)
 
 
 def get_combined_prob(race,
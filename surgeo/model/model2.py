@@ -0,0 +1,49 @@
+'''This is the fused model. Same results as model1, far fewer queries.
+
+   model1 asks the database for a single race probability at a time, so each
+   record costs six surname lookups and six zcta lookups (two queries each),
+   plus the existence checks done by the caller. This model fetches the
+   surname row and the zcta race row at most once each and computes all six
+   posteriors q(i|j,k) from them.
+
+   Where u(i,j,k) = p(i|j) * r(k|i):
+
+                                         u(i,j,k)
+   q(i|j,k) = ---------------------------------------------------------------
+              u(1,j,k) + u(2,j,k) + u(3,j,k) + u(4,j,k) + u(5,j,k) + u(6,j,k)
+
+'''
+
+import surgeo
+import surgeo.model.batch
+import surgeo.model.engine
+
+
+def run_model(zcta, surname, db):
+    '''Takes zcta, surname. Returns data percentages.
+
+    Args:
+        zcta: int or text
+        surname: text (upper case)
+        db: Sqlite3 database connection instance or engine instance
+    Returns:
+        SurgeoResult instance, or SurgeoErrorResult if either the surname or
+        the zcta cannot be scored
+    Raises:
+        None
+
+    No existence check is needed before calling. A missing surname is
+    detected by the surname query and the zcta is never looked up.
+
+    '''
+
+    engine = surgeo.model.engine.get_engine(db)
+    surname_vector = engine.surname_vector(surname)
+    if surname_vector is None:
+        return surgeo.SurgeoErrorResult(surname, zcta)
+    zcta_vector = engine.zcta_vector(zcta)
+    combined = surgeo.model.batch.combine_vectors(zcta_vector,
+                                                  surname_vector)
+    if combined is None:
+        return surgeo.SurgeoErrorResult(surname, zcta)
+    return surgeo.SurgeoResult(surname, zcta, *combined)
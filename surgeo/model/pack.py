@@ -0,0 +1,269 @@
+'''Memory-mapped "pack" files. A read-only binary copy of the model tables.
+
+   A pack holds the same vectors as census.db, in the layout the 'memory'
+   engine keeps in RAM, but on disk: opening one is an mmap, not a load, and
+   processes that open the same pack share its pages in the page cache.
+
+   Layout (native byte order, sections aligned to 8 bytes):
+
+       header     MAGIC, VERSION, BYTE_ORDER_MARK, then per table (surname,
+                  zcta): rows, slots and the offsets of the four sections
+       key_ends   uint32 per row, end of the row's key in key_blob
+       key_blob   utf-8 keys, back to back
+       slots      uint32 open addressing hash table of row + 1 (0 = empty),
+                  probed linearly from crc32(key) modulo the slot count
+       probs      float64, six per row, in surgeo.model.model1.races order
+
+   Only keys with a usable vector are stored; any other key is a miss.'''
+
+import array
+import mmap
+import os
+import struct
+import tempfile
+import zlib
+
+import surgeo
+import surgeo.model.lookup
+
+MAGIC = b'SURGEOPK'
+VERSION = 1
+BYTE_ORDER_MARK = 0x01020304
+
+# Pack file name, kept next to census.db
+PACK_NAME = 'census.pack'
+
+_HEADER = struct.Struct('=8sII' + 'IIQQQQ' * 2)
+
+
+def get_pack_path(db):
+    '''Returns the pack path beside the main file of a db connection.'''
+    db_path = _get_db_path(db)
+    if db_path is None:
+        raise surgeo.SurgeoError('A pack needs an on-disk census.db.')
+    return os.path.join(os.path.dirname(db_path), PACK_NAME)
+
+
+def _get_db_path(db):
+    '''Returns the file path of the main database, or None if in memory.'''
+    for _, name, filename in db.execute('PRAGMA database_list'):
+        if name == 'main' and filename:
+            return filename
+    return None
+
+
+def build_pack(db, pack_path):
+    '''Writes a pack of every usable vector in db.
+
+    Args:
+        db: Sqlite3 database connection instance
+        pack_path: file path of the pack to write
+    Returns:
+        None
+    Raises:
+        None
+
+    The pack is written to a temporary file and moved into place, so a
+    process opening pack_path never sees a partly written pack.
+
+    '''
+
+    data = build_pack_bytes(db)
+    pack_dir = os.path.dirname(os.path.abspath(pack_path))
+    descriptor, temp_path = tempfile.mkstemp(dir=pack_dir, suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as pack_file:
+            pack_file.write(data)
+        os.replace(temp_path, pack_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def build_pack_bytes(db):
+    '''Returns a pack of every usable vector in db as a bytearray.'''
+    tables = [_pack_table(surgeo.model.lookup.iter_surname_vectors(db)),
+              _pack_table(surgeo.model.lookup.iter_zcta_vectors(db))]
+    offset = _align(_HEADER.size)
+    header_fields = [MAGIC, VERSION, BYTE_ORDER_MARK]
+    sections = []
+    for rows, key_ends, key_blob, slots, probs in tables:
+        section_offsets = []
+        for section in (key_ends, key_blob, slots, probs):
+            section_offsets.append(offset)
+            sections.append((offset, section))
+            offset = _align(offset + len(section) * (
+                1 if isinstance(section, bytes) else section.itemsize))
+        header_fields.extend([rows, len(slots)] + section_offsets)
+    data = bytearray(offset)
+    _HEADER.pack_into(data, 0, *header_fields)
+    for section_offset, section in sections:
+        section_bytes = memoryview(section).cast('B')
+        data[section_offset:section_offset + len(section_bytes)] = \
+            section_bytes
+    return data
+
+
+def _align(offset):
+    return (offset + 7) // 8 * 8
+
+
+def _pack_table(pairs):
+    '''Returns (rows, key_ends, key_blob, slots, probs) for one table.'''
+    seen = set()
+    keys = []
+    probs = array.array('d')
+    for key, vector in pairs:
+        # First row for a key wins, as with a database lookup
+        if key in seen:
+            continue
+        seen.add(key)
+        if vector is None:
+            continue
+        keys.append(key.encode('utf-8'))
+        probs.extend(vector)
+    key_ends = array.array('I')
+    end = 0
+    for key in keys:
+        end += len(key)
+        key_ends.append(end)
+    # Power of two at least twice the row count keeps probe chains short
+    slot_count = 1
+    while slot_count < len(keys) * 2:
+        slot_count *= 2
+    mask = slot_count - 1
+    slots = array.array('I', bytes(4 * slot_count))
+    for row, key in enumerate(keys):
+        slot = zlib.crc32(key) & mask
+        while slots[slot]:
+            slot = (slot + 1) & mask
+        slots[slot] = row + 1
+    return len(keys), key_ends, b''.join(keys), slots, probs
+
+
+class PackTable(object):
+    '''One table of a pack: keyed lookups into memoryviews of the mmap.
+
+    Attributes:
+        self.rows: number of keys stored
+
+    '''
+
+    def __init__(self, buffer, rows, slot_count, key_ends_offset,
+                 key_blob_offset, slots_offset, probs_offset):
+        self.rows = rows
+        self._mask = slot_count - 1
+        self._key_ends = buffer[key_ends_offset:
+                                key_ends_offset + 4 * rows].cast('I')
+        self._key_blob = buffer[key_blob_offset:slots_offset]
+        self._slots = buffer[slots_offset:
+                             slots_offset + 4 * slot_count].cast('I')
+        self._probs = buffer[probs_offset:
+                             probs_offset + 8 * 6 * rows].cast('d')
+
+    def __len__(self):
+        return self.rows
+
+    def find(self, key):
+        '''Returns the row number of key, or None if it is not stored.'''
+        data = key.encode('utf-8')
+        key_ends = self._key_ends
+        slots = self._slots
+        mask = self._mask
+        slot = zlib.crc32(data) & mask
+        while True:
+            row = slots[slot] - 1
+            if row < 0:
+                return None
+            start = key_ends[row - 1] if row else 0
+            if self._key_blob[start:key_ends[row]] == data:
+                return row
+            slot = (slot + 1) & mask
+
+    def vector(self, key):
+        '''Returns the six floats for key, or None if it is not stored.'''
+        row = self.find(key)
+        if row is None:
+            return None
+        return tuple(self._probs[row * 6:row * 6 + 6])
+
+    def release(self):
+        for view in (self._key_ends, self._key_blob, self._slots,
+                     self._probs):
+            view.release()
+
+
+class Pack(object):
+    '''An open, memory-mapped pack file.
+
+    Attributes:
+        self.path: file path of the pack
+        self.surnames: PackTable of surname vectors
+        self.zctas: PackTable of zcta vectors
+    Methods:
+        close: releases the mapping.
+
+    '''
+
+    def __init__(self, pack_path):
+        self.path = pack_path
+        with open(pack_path, 'rb') as pack_file:
+            self._mmap = mmap.mmap(pack_file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        self._open_buffer(memoryview(self._mmap))
+
+    def _open_buffer(self, buffer):
+        '''Checks the header of a pack in buffer and opens its tables.'''
+        self._buffer = buffer
+        self.surnames = None
+        self.zctas = None
+        fields = _HEADER.unpack_from(buffer)
+        if fields[0] != MAGIC or fields[1] != VERSION:
+            self.close()
+            raise surgeo.SurgeoError('{} is not a version {} surgeo pack.'
+                                     .format(self.path, VERSION))
+        if fields[2] != BYTE_ORDER_MARK:
+            self.close()
+            raise surgeo.SurgeoError('{} was built with another byte order. '
+                                     'Rebuild it on this machine.'
+                                     .format(self.path))
+        self.surnames = PackTable(buffer, *fields[3:9])
+        self.zctas = PackTable(buffer, *fields[9:15])
+
+    def _release(self):
+        for table in (self.surnames, self.zctas):
+            if table is not None:
+                table.release()
+        self.surnames = None
+        self.zctas = None
+        self._buffer.release()
+
+    def close(self):
+        '''Releases the memoryviews and the mapping.'''
+        self._release()
+        self._mmap.close()
+
+
+def open_pack(db, pack_path=None):
+    '''Opens the pack for db, building it first if missing or stale.
+
+    Args:
+        db: Sqlite3 database connection instance
+        pack_path: file path of the pack (default: beside census.db)
+    Returns:
+        Pack instance
+    Raises:
+        SurgeoError: if db is not on disk or the pack is unreadable
+
+    The pack is rebuilt when it is older than census.db.
+
+    '''
+
+    db_path = _get_db_path(db)
+    if pack_path is None:
+        pack_path = get_pack_path(db)
+    if not os.path.exists(pack_path) or (
+            db_path is not None and
+            os.path.getmtime(pack_path) < os.path.getmtime(db_path)):
+        build_pack(db, pack_path)
+    return Pack(pack_path)
@@ -0,0 +1,183 @@
+'''Model tables published once into shared memory for worker processes.
+
+   The first model opened with engine='shared' in a process builds a pack
+   (see surgeo.model.pack) of census.db into a multiprocessing.shared_memory
+   block. The process, not the model, holds the block: every later model
+   on the same census.db in the process reuses it, and it stays published
+   until the process exits (or close() is called on it), however many of
+   those models have been dropped. process_csv workers only attach to
+   their parent's block (see attach_worker); they never publish one.
+
+   The block is named after census.db's path and modification time. A
+   block is being written until its header appears, so an attaching
+   process polls for the header for up to ATTACH_TIMEOUT seconds. Attach
+   from processes started by the publisher (multiprocessing children); an
+   unrelated process should use engine='pack', whose file pages the
+   operating system already shares.'''
+
+import os
+import threading
+import time
+import weakref
+import zlib
+from multiprocessing import shared_memory
+
+import surgeo
+import surgeo.model.pack
+from surgeo.model.pack import Pack
+
+# Seconds an attaching process waits for a block to be published, and
+# seconds between looks
+ATTACH_TIMEOUT = 10.0
+ATTACH_POLL = 0.01
+
+# Blocks this process published or attached to, by name, held for the
+# life of the process rather than of the model that opened them
+_held = {}
+_held_lock = threading.Lock()
+
+# True in pool workers, which attach to their parent's block only
+_attach_only = False
+
+
+def get_shared_name(db):
+    '''Returns the shared memory block name for a db connection.'''
+    db_path = os.path.realpath(surgeo.model.pack._get_db_path(db) or '')
+    if not os.path.exists(db_path):
+        raise surgeo.SurgeoError('Shared tables need an on-disk census.db.')
+    key = '{}:{}'.format(db_path, os.stat(db_path).st_mtime_ns)
+    return 'surgeo_{:08x}'.format(zlib.crc32(key.encode('utf-8')))
+
+
+class SharedPack(Pack):
+    '''A pack held in a shared memory block.
+
+    Attributes:
+        self.path: name of the shared memory block
+        self.owner: True if this process published the block
+        self.surnames: PackTable of surname vectors
+        self.zctas: PackTable of zcta vectors
+    Methods:
+        close: detaches, and removes the block if this is its owner.
+
+    '''
+
+    def __init__(self, name, data=None):
+        self.path = name
+        self.owner = data is not None
+        if data is None:
+            self._memory = shared_memory.SharedMemory(name)
+        else:
+            self._memory = shared_memory.SharedMemory(name,
+                                                      create=True,
+                                                      size=len(data))
+        # The finalizer releases the tables' views before closing the
+        # block. Forked children inherit it but must not remove the block.
+        tables = []
+        self._finalizer = weakref.finalize(self, _close_memory, self._memory,
+                                           tables, self.owner and os.getpid())
+        if data is not None:
+            # Header (magic) last: _attach polls for it, so it opens the
+            # pack only once the rest is written
+            self._memory.buf[8:len(data)] = memoryview(data)[8:]
+            self._memory.buf[:8] = memoryview(data)[:8]
+        self._open_buffer(self._memory.buf)
+        tables.extend([self.surnames, self.zctas])
+
+    def close(self):
+        '''Detaches, and removes the block if this process published it.'''
+        with _held_lock:
+            if _held.get(self.path) is self:
+                del _held[self.path]
+        self._release()
+        self._finalizer()
+
+
+def _close_memory(memory, tables, owner_pid):
+    for table in tables:
+        table.release()
+    del tables[:]
+    try:
+        memory.close()
+    except BufferError:
+        # Views are still exported; the mapping goes with the process
+        pass
+    if owner_pid == os.getpid():
+        try:
+            memory.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def open_shared(db):
+    '''Returns the shared tables for db, publishing them if needed.
+
+    Args:
+        db: Sqlite3 database connection instance
+    Returns:
+        SharedPack instance, the same one for every call in a process
+    Raises:
+        SurgeoError: if db is not on disk, or the block cannot be attached
+            to (in a pool worker, if the parent's block is gone)
+
+    '''
+
+    name = get_shared_name(db)
+    with _held_lock:
+        pack = _held.get(name)
+        if pack is None:
+            pack = _open_block(name, db)
+            _held[name] = pack
+        return pack
+
+
+def attach_worker(name):
+    '''Makes this process a worker on block name, which its parent holds.
+
+    Args:
+        name: shared memory block name (see get_shared_name)
+    Returns:
+        None
+    Raises:
+        SurgeoError: if the block is not published within ATTACH_TIMEOUT
+
+    Afterwards open_shared never publishes a block in this process, so
+    workers cannot race each other to publish one nobody removes.
+
+    '''
+
+    global _attach_only
+    _attach_only = True
+    with _held_lock:
+        if name not in _held:
+            _held[name] = _attach(name)
+
+
+def _open_block(name, db):
+    try:
+        return _attach(name)
+    except FileNotFoundError:
+        if _attach_only:
+            raise surgeo.SurgeoError('No shared tables {} to attach to. '
+                                     'census.db may have been replaced '
+                                     'since scoring started.'.format(name))
+    data = surgeo.model.pack.build_pack_bytes(db)
+    try:
+        return SharedPack(name, data)
+    except FileExistsError:
+        # Another process published first
+        return _attach(name)
+
+
+def _attach(name):
+    '''Attaches to block name, waiting while it is being written.'''
+    deadline = time.monotonic() + ATTACH_TIMEOUT
+    while True:
+        try:
+            return SharedPack(name)
+        except (ValueError, surgeo.SurgeoError):
+            # ValueError: created, not sized yet. SurgeoError: no header
+            # yet. Either way the publisher is still writing.
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(ATTACH_POLL)
@@ -0,0 +1,63 @@
+'''Times a census.db build from synthetic census archives.
+
+   Usage: python -m surgeo.scripts.bench_build [archive dir] [jobs]
+
+   Runs the setup steps of surgeo.data_setup() (surname table, geocode
+   tables, reconstitution, zcta probabilities and migration, publishing)
+   against archives written by surgeo.scripts.synthetic_archives, in a
+   temporary home directory, and reports the time of each step. State
+   archives are parsed in jobs processes (default 1). Without an archive
+   directory (or with '-'), archives the size of the 2000 census tables
+   are written first. Nothing is downloaded.'''
+
+import os
+import sys
+import tempfile
+import time
+
+import surgeo
+import surgeo.db
+from surgeo.scripts.synthetic_archives import build_synthetic_archives
+
+
+def main(archive_dir=None, jobs=1, surname_count=150000, zcta_count=33000):
+    temp_dir = tempfile.mkdtemp()
+    if archive_dir in (None, '-'):
+        archive_dir = os.path.join(temp_dir, 'archives')
+        sys.stdout.write('Writing synthetic archives ... \t\t')
+        sys.stdout.flush()
+        build_synthetic_archives(archive_dir, surname_count, zcta_count)
+        sys.stdout.write('OK\n')
+    # The setup functions build in ~/.surgeo
+    home_dir = os.path.join(temp_dir, 'home')
+    os.mkdir(home_dir)
+    os.environ['HOME'] = home_dir
+    os.environ['USERPROFILE'] = home_dir
+    surgeo.utilities.setup_folder(False)
+    surname_archive, geocode_archives = surgeo.db.stage_archives(
+        False, archive_dir)
+    db_path = os.path.join(home_dir, '.surgeo', 'census.db')
+    build_path = db_path + surgeo.db.db_build.BUILD_SUFFIX
+    steps = (('surname table', surgeo.db.setup_surname_table,
+              (False, surname_archive, build_path)),
+             ('geocode tables', surgeo.db.setup_geocode_table,
+              (False, geocode_archives, jobs, build_path)),
+             ('reconstitution', surgeo.db.reconstitute_data, (build_path,)),
+             ('migration', surgeo.db.migrate_db, (False, build_path)),
+             ('publishing', surgeo.db.publish_build,
+              (False, build_path, db_path)))
+    total = 0.0
+    for name, function, arguments in steps:
+        start = time.perf_counter()
+        function(*arguments)
+        elapsed = time.perf_counter() - start
+        total += elapsed
+        sys.stdout.write('{:<16}{:8.2f} s\n'.format(name, elapsed))
+    sys.stdout.write('{:<16}{:8.2f} s ({:.1f} MB)\n'.format(
+        'total', total, os.path.getsize(db_path) / 2 ** 20))
+
+
+if __name__ == '__main__':
+    arguments = sys.argv[1:]
+    main(arguments[0] if arguments else None,
+         *[int(argument) for argument in arguments[1:]])
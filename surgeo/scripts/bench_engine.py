@@ -0,0 +1,89 @@
+'''Compares the 'sqlite', 'memory' and 'pack' engines.
+
+   Usage: python -m surgeo.scripts.bench_engine [census.db] [lookups]
+
+   Reports the memory held by the memory engine, its load time, the pack
+   build and open times, and the per-lookup latency of each engine. Without
+   a database path a synthetic database the size of the 2000 census tables
+   is built in a temp folder.'''
+
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import surgeo
+import surgeo.model.pack
+from surgeo.scripts.synthetic_db import build_synthetic_db
+
+
+def time_lookups(function, keys):
+    '''Returns microseconds per call of function over keys.'''
+    start = time.perf_counter()
+    for key in keys:
+        function(key)
+    return (time.perf_counter() - start) / len(keys) * 1e6
+
+
+def main(db_path=None, lookups=200000):
+    if db_path is None:
+        temp_dir = tempfile.mkdtemp()
+        db_path = os.path.join(temp_dir, 'census.db')
+        sys.stdout.write('Building synthetic db ... \t\t\t')
+        sys.stdout.flush()
+        build_synthetic_db(db_path)
+        sys.stdout.write('OK\n')
+    db = sqlite3.connect(db_path)
+    surnames = [row[0] for row in db.execute('SELECT name FROM surname_data')]
+    zctas = [row[0] for row in db.execute('SELECT zcta FROM geocode_data')]
+    tracemalloc.start()
+    start = time.perf_counter()
+    memory_engine = surgeo.model.engine.MemoryEngine(db)
+    load_time = time.perf_counter() - start
+    footprint, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    sys.stdout.write('memory engine: {} surnames, {} zctas, loaded in '
+                     '{:.2f}s, {:.1f} MB held ({:.1f} MB peak)\n'.format(
+                         len(memory_engine.surname_index),
+                         len(memory_engine.zcta_index),
+                         load_time,
+                         footprint / 2 ** 20,
+                         peak / 2 ** 20))
+    pack_path = os.path.join(os.path.dirname(os.path.abspath(db_path)),
+                             'bench.pack')
+    start = time.perf_counter()
+    surgeo.model.pack.build_pack(db, pack_path)
+    build_time = time.perf_counter() - start
+    start = time.perf_counter()
+    pack_engine = surgeo.model.engine.PackEngine(
+        surgeo.model.pack.Pack(pack_path))
+    open_time = time.perf_counter() - start
+    sys.stdout.write('pack engine: built in {:.2f}s, opened in {:.2f} ms, '
+                     '{:.1f} MB on disk\n'.format(
+                         build_time,
+                         open_time * 1e3,
+                         os.path.getsize(pack_path) / 2 ** 20))
+    sqlite_engine = surgeo.model.engine.SqliteEngine(db)
+    rng = random.Random(0)
+    surname_keys = [rng.choice(surnames) for _ in range(lookups)]
+    zcta_keys = [rng.choice(zctas) for _ in range(lookups)]
+    for name, engine in (('sqlite', sqlite_engine),
+                         ('memory', memory_engine),
+                         ('pack', pack_engine)):
+        sys.stdout.write('{}: surname {:.2f} us/lookup, zcta {:.2f} '
+                         'us/lookup\n'.format(
+                             name,
+                             time_lookups(engine.surname_vector,
+                                          surname_keys),
+                             time_lookups(engine.zcta_vector, zcta_keys)))
+    pack_engine.pack.close()
+    os.remove(pack_path)
+
+
+if __name__ == '__main__':
+    arguments = sys.argv[1:]
+    main(arguments[0] if arguments else None,
+         int(arguments[1]) if len(arguments) > 1 else 200000)
@@ -0,0 +1,58 @@
+'''Import-time benchmark for the surgeo package.
+
+   Usage: python -m surgeo.scripts.bench_import [runs] [statement]
+
+   Runs 'python -X importtime -c <statement>' (default 'import surgeo') in
+   fresh interpreters and reports the median and best total import time,
+   then the slowest modules of the median run by cumulative time. Heavy
+   modules such as surgeo.db (ftplib, urllib, zipfile) and
+   multiprocessing should not appear for a plain 'import surgeo'.'''
+
+import subprocess
+import sys
+
+
+def import_times(statement):
+    '''Returns [(indented module, self us, cumulative us)] for one run.'''
+    completed = subprocess.run([sys.executable, '-X', 'importtime',
+                                '-c', statement],
+                               stdout=subprocess.DEVNULL,
+                               stderr=subprocess.PIPE,
+                               universal_newlines=True,
+                               check=True)
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, module = line[len('import time:'):].split('|')
+        # Drop the separator space, keep the indent that shows nesting
+        rows.append((module[1:].rstrip(), int(own), int(cumulative)))
+    return rows
+
+
+def main(runs=20, statement='import surgeo'):
+    results = []
+    for _ in range(runs):
+        rows = import_times(statement)
+        # Top-level imports are not indented; their cumulative times add up
+        total = sum(cumulative for module, _, cumulative in rows
+                    if not module.startswith(' '))
+        results.append((total, rows))
+    results.sort(key=lambda result: result[0])
+    median_total, median_rows = results[len(results) // 2]
+    sys.stdout.write('{!r}: median {:.1f} ms, best {:.1f} ms over {} '
+                     'runs\n'.format(statement,
+                                     median_total / 1000,
+                                     results[0][0] / 1000,
+                                     runs))
+    sys.stdout.write('Slowest modules (cumulative ms) in the median run:\n')
+    slowest = sorted(median_rows, key=lambda row: row[2], reverse=True)
+    for module, _, cumulative in slowest[:15]:
+        sys.stdout.write('    {:8.1f}  {}\n'.format(cumulative / 1000,
+                                                    module.strip()))
+
+
+if __name__ == '__main__':
+    arguments = sys.argv[1:]
+    main(int(arguments[0]) if arguments else 20,
+         arguments[1] if len(arguments) > 1 else 'import surgeo')
@@ -0,0 +1,84 @@
+'''Compares chunked IN (...) batch lookups with one query per key.
+
+   Usage: python -m surgeo.scripts.bench_lookup [census.db] [keys]
+
+   Times surgeo.model.lookup.get_surname_vectors and get_zcta_vectors
+   against a loop of get_surname_vector / get_zcta_vector calls (the
+   previous implementation) for the same distinct keys, one tenth of them
+   missing, and checks that both return the same vectors. zcta lookups are
+   timed with and without the zcta_race_prob table. Without a database
+   path a synthetic database the size of the 2000 census tables is built.'''
+
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+import surgeo
+import surgeo.db
+from surgeo.scripts.synthetic_db import build_synthetic_db
+
+
+def per_key(function, keys, db):
+    '''The previous batch lookup: one query per distinct key.'''
+    return {key: function(key, db) for key in set(keys)}
+
+
+def compare(label, single, batch, keys, db):
+    '''Times both lookups over keys and checks they agree.'''
+    start = time.perf_counter()
+    expected = per_key(single, keys, db)
+    loop_time = time.perf_counter() - start
+    start = time.perf_counter()
+    found = batch(keys, db)
+    batch_time = time.perf_counter() - start
+    if found != expected:
+        raise surgeo.SurgeoError('{} lookups differ.'.format(label))
+    sys.stdout.write('{}: {} keys, per-key {:.1f} ms, IN-list {:.1f} ms '
+                     '({:.1f}x)\n'.format(label,
+                                          len(keys),
+                                          loop_time * 1e3,
+                                          batch_time * 1e3,
+                                          loop_time / batch_time))
+
+
+def main(db_path=None, count=20000):
+    if db_path is None:
+        temp_dir = tempfile.mkdtemp()
+        db_path = os.path.join(temp_dir, 'census.db')
+        sys.stdout.write('Building synthetic db ... \t\t\t')
+        sys.stdout.flush()
+        build_synthetic_db(db_path)
+        sys.stdout.write('OK\n')
+    db = sqlite3.connect(db_path)
+    surnames = [row[0] for row in db.execute('SELECT name FROM surname_data')]
+    zctas = [row[0] for row in db.execute('SELECT zcta FROM geocode_data')]
+    rng = random.Random(0)
+    surname_keys = rng.sample(surnames, min(count, len(surnames)))
+    zcta_keys = rng.sample(zctas, min(count, len(zctas)))
+    # One key in ten is not in the database
+    for index in range(0, len(surname_keys), 10):
+        surname_keys[index] = 'NOTANAME{}'.format(index)
+    for index in range(0, len(zcta_keys), 10):
+        zcta_keys[index] = 'Z{:05d}'.format(index)
+    lookup = surgeo.model.lookup
+    compare('surname', lookup.get_surname_vector,
+            lookup.get_surname_vectors, surname_keys, db)
+    has_table = db.execute('''SELECT COUNT(*) FROM sqlite_master WHERE
+                              name='zcta_race_prob' ''').fetchone()[0]
+    if not has_table:
+        compare('zcta (join)', lookup.get_zcta_vector,
+                lookup.get_zcta_vectors, zcta_keys, db)
+        db.close()
+        surgeo.db.setup_zcta_race_table(False, db_path)
+        db = sqlite3.connect(db_path)
+    compare('zcta (zcta_race_prob)', lookup.get_zcta_vector,
+            lookup.get_zcta_vectors, zcta_keys, db)
+
+
+if __name__ == '__main__':
+    arguments = sys.argv[1:]
+    main(arguments[0] if arguments else None,
+         int(arguments[1]) if len(arguments) > 1 else 20000)
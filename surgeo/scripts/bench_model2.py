@@ -0,0 +1,85 @@
+'''Benchmarks model1 against the fused model2 and checks they agree.
+
+   Usage: python -m surgeo.scripts.bench_model2 [census.db] [records]
+
+   Without a database path a synthetic database is built in a temp folder.'''
+
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+import surgeo
+from surgeo.scripts.synthetic_db import build_synthetic_db
+
+
+def model1_record(zcta, surname, db):
+    '''Scores one record the way SurgeoModel.race_data used to.'''
+    try:
+        cursor = db.cursor()
+        cursor.execute('''SELECT state, logical_record FROM
+                       geocode_data WHERE zcta=?''', (zcta,))
+        state, logical_record = cursor.fetchone()
+        cursor.execute('''SELECT pctwhite, pctblack FROM
+                       surname_data WHERE name=?''', (surname,))
+        num_white, num_black = cursor.fetchone()
+        return surgeo.model.model1.run_model(zcta, surname, db)
+    except TypeError:
+        return surgeo.SurgeoErrorResult()
+
+
+def count_queries(function, zcta, surname, db):
+    '''Counts statements issued to SQLite while running function.'''
+    counter = [0]
+
+    def trace(statement):
+        counter[0] += 1
+
+    db.set_trace_callback(trace)
+    function(zcta, surname, db)
+    db.set_trace_callback(None)
+    return counter[0]
+
+
+def main(db_path=None, records=20000):
+    if db_path is None:
+        temp_dir = tempfile.mkdtemp()
+        db_path = os.path.join(temp_dir, 'census.db')
+        sys.stdout.write('Building synthetic db ... \t\t\t')
+        sys.stdout.flush()
+        build_synthetic_db(db_path)
+        sys.stdout.write('OK\n')
+    db = sqlite3.connect(db_path)
+    surnames = [row[0] for row in db.execute('SELECT name FROM surname_data')]
+    zctas = [row[0] for row in db.execute('SELECT zcta FROM geocode_data')]
+    rng = random.Random(0)
+    pairs = [(rng.choice(zctas), rng.choice(surnames))
+             for _ in range(records)]
+    timings = {}
+    outputs = {}
+    for name, function in (('model1', model1_record),
+                           ('model2', surgeo.model.model2.run_model)):
+        start = time.perf_counter()
+        outputs[name] = [function(zcta, surname, db).as_string
+                         for zcta, surname in pairs]
+        timings[name] = time.perf_counter() - start
+        queries = count_queries(function, pairs[0][0], pairs[0][1], db)
+        sys.stdout.write('{}: {:.2f}s for {} records, {:.1f} us/record, '
+                         '{} queries/record\n'.format(
+                             name,
+                             timings[name],
+                             records,
+                             timings[name] / records * 1e6,
+                             queries))
+    if outputs['model1'] != outputs['model2']:
+        raise surgeo.SurgeoError('model1 and model2 results differ.')
+    sys.stdout.write('Results identical. Speedup: {:.1f}x\n'.format(
+        timings['model1'] / timings['model2']))
+
+
+if __name__ == '__main__':
+    arguments = sys.argv[1:]
+    main(arguments[0] if arguments else None,
+         int(arguments[1]) if len(arguments) > 1 else 20000)
@@ -0,0 +1,95 @@
+'''Micro-benchmark of SurgeoResult construction.
+
+   Usage: python -m surgeo.scripts.bench_results [results]
+
+   Compares the current float-backed, __slots__ based SurgeoResult with the
+   previous design, which formatted all six probabilities to strings for
+   every record and sorted a dict to find the most probable race.'''
+
+import operator
+import random
+import sys
+import time
+import tracemalloc
+
+import surgeo
+
+
+class LegacyResult(object):
+    '''The SurgeoResult design before floats and __slots__.'''
+
+    def __init__(self,
+                 surname,
+                 zcta,
+                 hispanic,
+                 white,
+                 black,
+                 asian_or_pi,
+                 american_indian,
+                 multiracial):
+        self.surname = surname
+        self.zcta = zcta
+        self.zip = zcta
+        self.hispanic = hispanic
+        self.white = white
+        self.black = black
+        self.asian_or_pi = asian_or_pi
+        self.american_indian = american_indian
+        self.multiracial = multiracial
+
+    @property
+    def probable_race(self):
+        rank_dict = {'Hispanic': self.hispanic,
+                     'White': self.white,
+                     'Black': self.black,
+                     'Asian / Pacific Islander': self.asian_or_pi,
+                     'American Indian / Alaskan Eskimo': self.american_indian,
+                     'Multiracial': self.multiracial}
+        return sorted(rank_dict.items(),
+                      key=operator.itemgetter(1),
+                      reverse=True)[0][0]
+
+
+def build_legacy(rows):
+    return [LegacyResult('SMITH', '55401',
+                         *['{0:f}'.format(prob) for prob in row])
+            for row in rows]
+
+
+def build_current(rows):
+    return [surgeo.SurgeoResult('SMITH', '55401', *row) for row in rows]
+
+
+def main(count=200000):
+    rng = random.Random(0)
+    rows = []
+    for _ in range(count):
+        weights = [rng.random() for _ in range(6)]
+        total = sum(weights)
+        rows.append(tuple(weight / total for weight in weights))
+    for name, build in (('legacy', build_legacy),
+                        ('current', build_current)):
+        start = time.perf_counter()
+        results = build(rows)
+        built = time.perf_counter() - start
+        start = time.perf_counter()
+        for result in results:
+            result.probable_race
+        ranked = time.perf_counter() - start
+        del results
+        tracemalloc.start()
+        results = build(rows)
+        size, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del results
+        sys.stdout.write('{}: construct {:.2f} us, probable_race {:.2f} us, '
+                         '{:.0f} bytes per result\n'.format(
+                             name,
+                             built / count * 1e6,
+                             ranked / count * 1e6,
+                             size / count))
+
+
+if __name__ == '__main__':
+    arguments = sys.argv[1:]
+    main(int(arguments[0]) if arguments else 200000)
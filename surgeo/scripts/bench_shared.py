@@ -0,0 +1,84 @@
+'''Compares worker memory for the 'memory' and 'shared' engines.
+
+   Usage: python -m surgeo.scripts.bench_shared [census.db] [max workers]
+
+   Starts 1, 2, 4, ... worker processes that each open an engine and read
+   every vector, then reports the total proportional set size (PSS) of the
+   workers, which splits shared pages between the processes mapping them.
+   Linux only (reads /proc/self/smaps_rollup). Without a database path a
+   synthetic database the size of the 2000 census tables is built.'''
+
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+
+import surgeo
+import surgeo.model.shared
+from surgeo.scripts.synthetic_db import build_synthetic_db
+
+
+def read_pss():
+    '''Returns this process's proportional set size in MB.'''
+    with open('/proc/self/smaps_rollup') as smaps:
+        for line in smaps:
+            if line.startswith('Pss:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def worker(db_path, engine_name, results, done):
+    db = sqlite3.connect(db_path)
+    engine = surgeo.model.engine.create_engine(engine_name, db)
+    for key, _ in surgeo.model.lookup.iter_surname_vectors(db):
+        engine.surname_vector(key)
+    for key, _ in surgeo.model.lookup.iter_zcta_vectors(db):
+        engine.zcta_vector(key)
+    results.put(read_pss())
+    # Stay alive until every worker has measured, so pages stay shared
+    done.wait()
+
+
+def measure(db_path, engine_name, workers):
+    '''Returns total worker PSS in MB for engine_name with workers.'''
+    results = multiprocessing.Queue()
+    done = multiprocessing.Event()
+    processes = [multiprocessing.Process(target=worker,
+                                         args=(db_path, engine_name,
+                                               results, done))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    total = sum(results.get() for _ in processes)
+    done.set()
+    for process in processes:
+        process.join()
+    return total
+
+
+def main(db_path=None, max_workers=8):
+    if db_path is None:
+        temp_dir = tempfile.mkdtemp()
+        db_path = os.path.join(temp_dir, 'census.db')
+        sys.stdout.write('Building synthetic db ... \t\t\t')
+        sys.stdout.flush()
+        build_synthetic_db(db_path)
+        sys.stdout.write('OK\n')
+    # Publish once in the parent; workers attach
+    shared = surgeo.model.shared.open_shared(sqlite3.connect(db_path))
+    workers = 1
+    while workers <= max_workers:
+        sys.stdout.write('{} workers: memory {:.1f} MB, shared {:.1f} MB '
+                         'total PSS\n'.format(
+                             workers,
+                             measure(db_path, 'memory', workers),
+                             measure(db_path, 'shared', workers)))
+        workers *= 2
+    shared.close()
+
+
+if __name__ == '__main__':
+    arguments = sys.argv[1:]
+    main(arguments[0] if arguments else None,
+         int(arguments[1]) if len(arguments) > 1 else 8)
@@ -0,0 +1,148 @@
+'''This writes synthetic census archives for offline setup and benchmarks.
+
+   Usage: python -m surgeo.scripts.synthetic_archives DIR [surnames] [zctas]
+
+   DIR gets names.zip (app_c.csv) and, in one folder per state, the
+   XXgeo_uf1.zip and XX00002_uf1.zip archives, laid out like the census
+   server so that 'surgeo --setup --from-dir DIR' builds from them. Records
+   use the fixed-width and comma-separated formats of Summary File 1, but
+   the values are randomly generated.'''
+
+import os
+import random
+import string
+import sys
+import zipfile
+
+# (folder, postal code) of the states written, in census server order
+STATES = (('Alabama', 'AL'), ('Alaska', 'AK'), ('Arizona', 'AZ'),
+          ('Arkansas', 'AR'), ('California', 'CA'), ('Colorado', 'CO'),
+          ('Connecticut', 'CT'), ('Delaware', 'DE'),
+          ('District_of_Columbia', 'DC'), ('Florida', 'FL'),
+          ('Georgia', 'GA'), ('Hawaii', 'HI'), ('Idaho', 'ID'),
+          ('Illinois', 'IL'), ('Indiana', 'IN'), ('Iowa', 'IA'),
+          ('Kansas', 'KS'), ('Kentucky', 'KY'), ('Louisiana', 'LA'),
+          ('Maine', 'ME'), ('Maryland', 'MD'), ('Massachusetts', 'MA'),
+          ('Michigan', 'MI'), ('Minnesota', 'MN'), ('Mississippi', 'MS'),
+          ('Missouri', 'MO'), ('Montana', 'MT'), ('Nebraska', 'NE'),
+          ('Nevada', 'NV'), ('New_Hampshire', 'NH'), ('New_Jersey', 'NJ'),
+          ('New_Mexico', 'NM'), ('New_York', 'NY'),
+          ('North_Carolina', 'NC'), ('North_Dakota', 'ND'), ('Ohio', 'OH'),
+          ('Oklahoma', 'OK'), ('Oregon', 'OR'), ('Pennsylvania', 'PA'),
+          ('Rhode_Island', 'RI'), ('South_Carolina', 'SC'),
+          ('South_Dakota', 'SD'), ('Tennessee', 'TN'), ('Texas', 'TX'),
+          ('Utah', 'UT'), ('Vermont', 'VT'), ('Virginia', 'VA'),
+          ('Washington', 'WA'), ('West_Virginia', 'WV'),
+          ('Wisconsin', 'WI'), ('Wyoming', 'WY'))
+
+SURNAME_HEADER = ('name,rank,count,prop100k,cum_prop100k,pctwhite,pctblack,'
+                  'pctapi,pctaian,pct2prace,pcthispanic\n')
+
+# Geographic header records are 400 characters in Summary File 1
+GEO_RECORD_LENGTH = 400
+# Fields in a 00002 record; table P8 is fields 86 to 102
+RACE_FIELD_COUNT = 150
+
+
+def build_synthetic_archives(dir_path,
+                             surname_count=150000,
+                             zcta_count=33000,
+                             other_records=3,
+                             seed=0):
+    '''Writes census-like archives under dir_path.
+
+    Args:
+        dir_path: directory to write to (created if needed)
+        surname_count: number of rows written to app_c.csv
+        zcta_count: number of summary level 871 (zcta) geographic records
+        other_records: geographic records of other summary levels per zcta
+        seed: random seed so that runs are repeatable
+    Returns:
+        (surnames, zctas): lists of keys present in the archives
+    Raises:
+        None
+
+    One surname in 20 has a redacted '(S)' percentage, as in the census
+    file.
+
+    '''
+
+    rng = random.Random(seed)
+    if not os.path.exists(dir_path):
+        os.makedirs(dir_path)
+    surnames = set()
+    while len(surnames) < surname_count:
+        length = rng.randint(3, 10)
+        surnames.add(''.join(rng.choice(string.ascii_uppercase)
+                             for _ in range(length)))
+    surnames = sorted(surnames)
+    lines = [SURNAME_HEADER]
+    for rank, name in enumerate(surnames, start=1):
+        weights = [rng.random() for _ in range(6)]
+        total = sum(weights)
+        pcts = ['{:.2f}'.format(weight / total * 100) for weight in weights]
+        if rng.random() < 0.05:
+            pcts[rng.randrange(6)] = '(S)'
+        lines.append(','.join([name, str(rank),
+                               str(rng.randint(100, 2000000)),
+                               '0.0', '0.0'] + pcts) + '\n')
+    with zipfile.ZipFile(os.path.join(dir_path, 'names.zip'), 'w',
+                         zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('app_c.csv', ''.join(lines))
+    zctas = ['{0:05d}'.format(number) for number in
+             rng.sample(range(501, 99951), zcta_count)]
+    for state_index, (folder, code) in enumerate(STATES):
+        state_zctas = zctas[state_index::len(STATES)]
+        geo_lines = []
+        race_lines = []
+        logical_record = 0
+        for zcta in state_zctas:
+            for record in range(other_records + 1):
+                logical_record += 1
+                summary_level = '871' if record == 0 else rng.choice(
+                    ('040', '050', '140', '160'))
+                geo_lines.append(_geo_line(code, summary_level,
+                                           logical_record, zcta))
+                race_lines.append(_race_line(rng, code, logical_record))
+        state_dir = os.path.join(dir_path, folder)
+        if not os.path.exists(state_dir):
+            os.mkdir(state_dir)
+        prefix = code.lower()
+        for suffix, lines in (('geo', geo_lines), ('00002', race_lines)):
+            with zipfile.ZipFile(os.path.join(
+                    state_dir, '{}{}_uf1.zip'.format(prefix, suffix)),
+                    'w', zipfile.ZIP_DEFLATED) as archive:
+                archive.writestr('{}{}.uf1'.format(prefix, suffix),
+                                 ''.join(lines))
+    return surnames, zctas
+
+
+def _geo_line(code, summary_level, logical_record, zcta):
+    # FILEID, STUSAB at 6, SUMLEV at 8, LOGRECNO at 18, ZCTA5 at 160
+    line = ('uSF1  ' + code + summary_level + ' ' * 7 +
+            '{0:07d}'.format(logical_record))
+    line = line.ljust(160) + zcta
+    return line.ljust(GEO_RECORD_LENGTH) + '\n'
+
+
+def _race_line(rng, code, logical_record):
+    fields = ['uSF1', code, '000', '02', '{0:07d}'.format(logical_record)]
+    fields.extend(str(rng.randint(0, 5000))
+                  for _ in range(86 - len(fields)))
+    # P8: total, not hispanic, white, black, ai, asian, pacific islander,
+    # other, multiracial, hispanic, then the hispanic breakdown
+    counts = [rng.randint(0, 20000) for _ in range(7)]
+    hispanic = rng.randint(0, 20000)
+    not_hispanic = sum(counts)
+    fields.extend([str(not_hispanic + hispanic), str(not_hispanic)] +
+                  [str(count) for count in counts] + [str(hispanic)] +
+                  [str(rng.randint(0, 5000)) for _ in range(7)])
+    fields.extend(str(rng.randint(0, 5000))
+                  for _ in range(RACE_FIELD_COUNT - len(fields)))
+    return ','.join(fields) + '\n'
+
+
+if __name__ == '__main__':
+    arguments = sys.argv[1:]
+    build_synthetic_archives(arguments[0],
+                             *[int(argument) for argument in arguments[1:]])
@@ -0,0 +1,89 @@
+'''This builds a synthetic census.db for benchmarks and local testing.
+
+   The tables mirror the ones created by surgeo.data_setup(), but the rows
+   are randomly generated so that no download is required.'''
+
+import os
+import random
+import sqlite3
+import string
+import sys
+
+
+def build_synthetic_db(db_path,
+                       surname_count=150000,
+                       zcta_count=33000,
+                       seed=0):
+    '''Creates a census.db lookalike at db_path.
+
+    Args:
+        db_path: file path of the database to create (overwritten)
+        surname_count: number of rows written to surname_data
+        zcta_count: number of ZCTAs written to geocode_data
+        seed: random seed so that runs are repeatable
+    Returns:
+        (surnames, zctas): lists of keys present in the database
+    Raises:
+        None
+
+    '''
+
+    rng = random.Random(seed)
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    connection = sqlite3.connect(db_path)
+    cursor = connection.cursor()
+    cursor.execute('''CREATE TABLE surname_data (id
+                      INTEGER PRIMARY KEY, name TEXT, rank INTEGER,
+                      count INTEGER, prop1000K REAL, cum_prop100K REAL,
+                      pctwhite REAL, pctblack REAL, pctapi REAL,
+                      pctaian REAL, pct2prace REAL,
+                      pcthispanic REAL)''')
+    cursor.execute('''CREATE TABLE geocode_data(id INTEGER PRIMARY KEY,
+                      state TEXT, summary_level TEXT, logical_record TEXT,
+                      zcta TEXT)''')
+    cursor.execute('''CREATE TABLE logical_race_data(id
+                      INTEGER PRIMARY KEY, state TEXT, logical_record TEXT,
+                      num_white REAL, num_black REAL, num_ai REAL,
+                      num_api REAL, num_hispanic REAL, num_multi REAL)''')
+    surnames = set()
+    while len(surnames) < surname_count:
+        length = rng.randint(3, 10)
+        surnames.add(''.join(rng.choice(string.ascii_uppercase)
+                             for _ in range(length)))
+    surnames = sorted(surnames)
+    surname_rows = []
+    for rank, name in enumerate(surnames, start=1):
+        weights = [rng.random() for _ in range(6)]
+        total = sum(weights)
+        pcts = [round(weight / total * 100, 2) for weight in weights]
+        surname_rows.append((name, rank, rng.randint(100, 2000000),
+                             0.0, 0.0) + tuple(pcts))
+    cursor.executemany('''INSERT INTO surname_data VALUES (NULL, ?, ?, ?, ?,
+                          ?, ?, ?, ?, ?, ?, ?)''', surname_rows)
+    zctas = ['{0:05d}'.format(number) for number in
+             rng.sample(range(501, 99951), zcta_count)]
+    geocode_rows = []
+    race_rows = []
+    for index, zcta in enumerate(zctas):
+        state = '{0:02d}'.format(index % 50 + 1)
+        logical_record = '{0:07d}'.format(index)
+        geocode_rows.append((state, '871', logical_record, zcta))
+        race_rows.append((state, logical_record) +
+                         tuple(float(rng.randint(1, 20000))
+                               for _ in range(6)))
+    cursor.executemany('''INSERT INTO geocode_data VALUES (NULL, ?, ?, ?,
+                          ?)''', geocode_rows)
+    cursor.executemany('''INSERT INTO logical_race_data VALUES (NULL, ?, ?,
+                          ?, ?, ?, ?, ?, ?)''', race_rows)
+    cursor.execute('''CREATE INDEX name_index ON surname_data(name)''')
+    cursor.execute('''CREATE INDEX zcta_index ON geocode_data(zcta)''')
+    cursor.execute('''CREATE INDEX logical_record_index ON
+                      logical_race_data(logical_record)''')
+    connection.commit()
+    connection.close()
+    return surnames, zctas
+
+
+if __name__ == '__main__':
+    build_synthetic_db(sys.argv[1])
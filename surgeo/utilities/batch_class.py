@@ -0,0 +1,222 @@
+'''This is the columnar result class for batches of records.
+
+   Added to the surgeo namespace.'''
+
+import csv
+
+import surgeo
+import surgeo.utilities.result_class
+
+# Column names for the six probabilities, in model race order
+PROBABILITY_COLUMNS = ('hispanic',
+                       'white',
+                       'black',
+                       'asian_or_pi',
+                       'american_indian',
+                       'multiracial')
+
+
+class SurgeoResultBatch(object):
+    '''Columnar result class containing BISG data for many records.
+
+    Attributes:
+        self.surnames: list of strings, or None for a geocode only batch
+        self.zctas: list of strings, or None for a surname only batch
+        self.probabilities: array.array('d'), N x 6 in row-major order
+        self.race_codes: array.array('b'), 1-6, or 0 where not scored
+        self.columns: @property list of output column names
+    Methods:
+        row: builds the per-row result object for one record.
+        column: returns one probability column as an array.
+        iter_rows: yields output rows as lists without building objects.
+        iter_records: yields output rows as dicts with float probabilities.
+        write_csv: writes the batch to a csv file.
+        write_parquet: writes the batch to a parquet file (needs pyarrow).
+
+    Indexing with an int returns a SurgeoResult (SurResult or GeoResult for
+    single-factor batches, or the matching error result), built only when
+    asked for. Indexing with a slice returns a new SurgeoResultBatch.
+
+    '''
+
+    __slots__ = ('surnames', 'zctas', 'probabilities', 'race_codes')
+
+    def __init__(self, surnames, zctas, probabilities, race_codes):
+        if surnames is None and zctas is None:
+            raise surgeo.SurgeoError('Batch requires zctas, surnames, or '
+                                     'both.')
+        self.surnames = surnames
+        self.zctas = zctas
+        self.probabilities = probabilities
+        self.race_codes = race_codes
+
+    def __len__(self):
+        return len(self.race_codes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise surgeo.SurgeoError('Batch slices must be contiguous.')
+            return SurgeoResultBatch(
+                None if self.surnames is None else self.surnames[start:stop],
+                None if self.zctas is None else self.zctas[start:stop],
+                self.probabilities[start * 6:stop * 6],
+                self.race_codes[start:stop])
+        return self.row(index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.row(index)
+
+    @property
+    def columns(self):
+        columns = []
+        if self.surnames is not None:
+            columns.append('surname')
+        if self.zctas is not None:
+            columns.append('zip')
+        columns.extend(['probable_race', 'probable_race_percentage'])
+        columns.extend(PROBABILITY_COLUMNS)
+        return columns
+
+    def row(self, index):
+        '''Builds the result object for record number index.'''
+        if index < 0:
+            index += len(self)
+        race_code = self.race_codes[index]
+        if self.zctas is None:
+            if race_code == 0:
+                return surgeo.SurErrorResult(self.surnames[index])
+            return surgeo.SurResult(self.surnames[index],
+                                    *self.probabilities[index * 6:
+                                                        index * 6 + 6],
+                                    race_code=race_code)
+        if self.surnames is None:
+            if race_code == 0:
+                return surgeo.GeoErrorResult(self.zctas[index])
+            return surgeo.GeoResult(self.zctas[index],
+                                    *self.probabilities[index * 6:
+                                                        index * 6 + 6],
+                                    race_code=race_code)
+        if race_code == 0:
+            return surgeo.SurgeoErrorResult(self.surnames[index],
+                                            self.zctas[index])
+        return surgeo.SurgeoResult(self.surnames[index],
+                                   self.zctas[index],
+                                   *self.probabilities[index * 6:
+                                                       index * 6 + 6],
+                                   race_code=race_code)
+
+    def column(self, name):
+        '''Returns one probability column (e.g. 'black') as an array.'''
+        offset = PROBABILITY_COLUMNS.index(name)
+        return self.probabilities[offset::6]
+
+    def iter_rows(self):
+        '''Yields each record as a list in self.columns order.
+
+        Values match the as_row of the per-row result objects, including
+        error rows, but no result objects are built. Error rows keep their
+        input keys, so every row can be joined back to its input.
+
+        '''
+
+        race_names = surgeo.utilities.result_class.RACE_NAMES
+        key_columns = [column for column in (self.surnames, self.zctas)
+                       if column is not None]
+        error_values = ['Error', 0, 0, 0, 0, 0, 0, 0]
+        probabilities = self.probabilities
+        for index, race_code in enumerate(self.race_codes):
+            row = [column[index] for column in key_columns]
+            if race_code == 0:
+                row.extend(error_values)
+                yield row
+                continue
+            row.append(race_names[race_code - 1])
+            row.append('{0:f}'.format(
+                probabilities[index * 6 + race_code - 1]))
+            row.extend('{0:f}'.format(prob) for prob in
+                       probabilities[index * 6:index * 6 + 6])
+            yield row
+
+    def iter_records(self):
+        '''Yields each record as a dict keyed by self.columns.
+
+        Probabilities are floats rather than formatted strings. Records that
+        could not be scored keep their input keys and have None for
+        probable_race and every probability. Suited to JSON output.
+
+        '''
+
+        race_names = surgeo.utilities.result_class.RACE_NAMES
+        key_columns = [(name, column) for name, column in
+                       (('surname', self.surnames), ('zip', self.zctas))
+                       if column is not None]
+        probabilities = self.probabilities
+        for index, race_code in enumerate(self.race_codes):
+            record = dict((name, column[index])
+                          for name, column in key_columns)
+            if race_code == 0:
+                record['probable_race'] = None
+                record['probable_race_percentage'] = None
+                record.update((name, None) for name in PROBABILITY_COLUMNS)
+            else:
+                row = probabilities[index * 6:index * 6 + 6]
+                record['probable_race'] = race_names[race_code - 1]
+                record['probable_race_percentage'] = row[race_code - 1]
+                record.update(zip(PROBABILITY_COLUMNS, row))
+            yield record
+
+    def write_csv(self, filepath_out, header=True):
+        '''Writes the batch to a csv file.
+
+        Args:
+            filepath_out: file path of csv where data is written
+            header: True/False whether a header row is written first
+        Returns:
+            None
+        Raises:
+            None
+
+        '''
+
+        with open(filepath_out, 'w', newline='') as output_csv:
+            csv_writer = csv.writer(output_csv)
+            if header is True:
+                csv_writer.writerow(self.columns)
+            csv_writer.writerows(self.iter_rows())
+
+    def write_parquet(self, filepath_out):
+        '''Writes the batch to a parquet file. Requires pyarrow.
+
+        Args:
+            filepath_out: file path of parquet file where data is written
+        Returns:
+            None
+        Raises:
+            SurgeoError: if pyarrow is not installed
+
+        Probabilities are written as floats rather than formatted strings,
+        and rows that could not be scored have a null probable_race.
+
+        '''
+
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise surgeo.SurgeoError('Writing parquet requires pyarrow.')
+        race_names = surgeo.utilities.result_class.RACE_NAMES
+        data = {}
+        if self.surnames is not None:
+            data['surname'] = self.surnames
+        if self.zctas is not None:
+            data['zip'] = self.zctas
+        data['probable_race'] = [race_names[code - 1] if code else None
+                                 for code in self.race_codes]
+        data['race_code'] = self.race_codes.tolist()
+        for name in PROBABILITY_COLUMNS:
+            data[name] = self.column(name).tolist()
+        pyarrow.parquet.write_table(pyarrow.table(data), filepath_out)
+
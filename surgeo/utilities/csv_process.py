@@ -0,0 +1,195 @@
+'''Streaming csv processing shared by the model classes.
+
+   The input is read, scored and written one chunk of rows at a time, so
+   memory use is bounded by the chunk size rather than by the file size.'''
+
+import collections
+import csv
+import io
+import itertools
+import sys
+
+import surgeo
+import surgeo.model.batch
+
+# Rows read, scored and written at a time
+CHUNK_SIZE = 50000
+
+# Header substrings that identify the zip and surname columns
+ZIP_PATTERNS = ('zip', 'zcta')
+SURNAME_PATTERNS = ('last nam', 'surname')
+
+
+def find_columns(header_row, pattern_sets, error_message):
+    '''Finds the column index for each set of header substrings.
+
+    Args:
+        header_row: list of strings from row 1 of the csv
+        pattern_sets: list of tuples of lower case substrings
+        error_message: text of the SurgeoError if a column is missing
+    Returns:
+        list of column indexes, one per pattern set (last match wins)
+    Raises:
+        SurgeoError: if no header matches one of the pattern sets
+
+    '''
+
+    indexes = []
+    for patterns in pattern_sets:
+        found = None
+        for index, item in enumerate(header_row):
+            if any(pattern in item.lower() for pattern in patterns):
+                found = index
+        if found is None:
+            raise surgeo.SurgeoError(error_message)
+        indexes.append(found)
+    return indexes
+
+
+def iter_chunks(iterable, chunk_size):
+    '''Yields lists of up to chunk_size items from iterable.'''
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def process_csv(filepath_in,
+                filepath_out,
+                pattern_sets,
+                error_message,
+                header_remainder,
+                model,
+                summary=None,
+                chunk_size=CHUNK_SIZE,
+                verbose=True,
+                workers=1):
+    '''Reads, scores and writes a csv one chunk at a time.
+
+    Args:
+        filepath_in: file path of csv from which data is read
+        filepath_out: file path of csv where data is written
+        pattern_sets: header substrings for each key column (see
+                      find_columns), in model.score_batch argument order
+        error_message: text of the SurgeoError if a key column is missing
+        header_remainder: column names appended to the input header
+        model: SurgeoModel, SurModel or GeoModel instance
+        summary: optional BatchSummary that receives dedup counts
+        chunk_size: number of rows held in memory at a time (per worker)
+        verbose: True/False which determines if updates are printed
+        workers: number of processes scoring chunks in parallel
+    Returns:
+        number of data rows written
+    Raises:
+        SurgeoError: if a key column is missing
+
+    With more than one worker, chunks are scored in a process pool. Each
+    worker builds its own model, with its own database connection, and
+    output is written in the original row order.
+
+    '''
+
+    with open(filepath_in, 'r', newline='') as input_csv, \
+            open(filepath_out, 'w+', newline='') as output_csv:
+        csv_reader = csv.reader(input_csv)
+        csv_writer = csv.writer(output_csv)
+        row_1 = next(csv_reader)
+        number_of_columns = len(row_1)
+        key_indexes = find_columns(row_1, pattern_sets, error_message)
+        csv_writer.writerow(row_1 + list(header_remainder))
+        if verbose is True:
+            sys.stdout.write('\rReading from {}\n'.format(filepath_in))
+            sys.stdout.write('Writing to {}\n'.format(filepath_out))
+        chunks = iter_chunks(csv_reader, chunk_size)
+        if workers > 1:
+            scored = _score_parallel(model, chunks, key_indexes,
+                                     number_of_columns, workers)
+        else:
+            scored = (_score_chunk(model, entries, key_indexes,
+                                   number_of_columns)
+                      for entries in chunks)
+        rows_written = 0
+        for text, records, unique in scored:
+            output_csv.write(text)
+            if summary is not None:
+                summary.add(records, unique)
+            rows_written += records
+            if verbose is True:
+                sys.stdout.write('\rRows written: {}'.format(rows_written))
+                sys.stdout.flush()
+    if verbose is True:
+        sys.stdout.write('\n')
+    return rows_written
+
+
+def _score_chunk(model, entries, key_indexes, number_of_columns):
+    '''Scores rows and returns (csv text, records, distinct records).'''
+    summary = surgeo.model.batch.BatchSummary()
+    key_columns = [[entry[index] for entry in entries]
+                   for index in key_indexes]
+    results = model.score_batch(*key_columns, summary=summary)
+    line_buffer = io.StringIO()
+    # Chop rows in the event that rows are a different length
+    csv.writer(line_buffer).writerows(
+        entry[:number_of_columns] + result_list
+        for entry, result_list in zip(entries, results.iter_rows()))
+    return line_buffer.getvalue(), summary.records, summary.unique
+
+
+def _score_parallel(model, chunks, key_indexes, number_of_columns, workers):
+    '''Yields _score_chunk output for each chunk, in order, from a pool.
+
+    At most two chunks per worker are in flight, so memory stays bounded
+    by the chunk size no matter how large the input is.
+
+    '''
+
+    # Imported here: only --jobs needs it and it is slow to import
+    import multiprocessing
+    # Workers attach to the tables this process published
+    shared_name = None
+    if model.engine_name == 'shared':
+        import surgeo.model.shared
+        shared_name = surgeo.model.shared.get_shared_name(model.db)
+    pool = multiprocessing.Pool(workers,
+                                initializer=_init_worker,
+                                initargs=(type(model),
+                                          model.engine_name,
+                                          model.cache_size,
+                                          shared_name))
+    pending = collections.deque()
+    try:
+        for entries in chunks:
+            pending.append(pool.apply_async(_score_worker_chunk,
+                                            (entries,
+                                             key_indexes,
+                                             number_of_columns)))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+# Model used by _score_worker_chunk inside a pool worker process
+_worker_model = None
+
+
+def _init_worker(model_class, engine, cache_size, shared_name=None):
+    global _worker_model
+    if shared_name is not None:
+        import surgeo.model.shared
+        surgeo.model.shared.attach_worker(shared_name)
+    _worker_model = model_class(engine=engine, cache_size=cache_size)
+
+
+def _score_worker_chunk(entries, key_indexes, number_of_columns):
+    return _score_chunk(_worker_model, entries, key_indexes,
+                        number_of_columns)
@@ -1,6 +1,8 @@
 
 import os
 
+import surgeo.model.connection
+
 
 def folder_cleanup():
     '''Delete all .uf1 and .zip files in folder.
@@ -23,5 +25,9 @@ def folder_cleanup():
             continue
         if filename == 'logo.gif':
             continue
+        # Pins of earlier builds that running models still read
+        if filename.startswith('census.db' +
+                               surgeo.model.connection.PIN_SUFFIX):
+            continue
         os.remove(os.path.join(data_dir_path,
                                filename))
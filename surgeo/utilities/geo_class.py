@@ -2,15 +2,12 @@
 
    Added to the surgeo namespace.'''
 
-import csv
-import io
-import itertools
-import operator
 import os
-import sqlite3
 import sys
 
 import surgeo
+import surgeo.utilities.csv_process
+import surgeo.utilities.result_class
 
 ###############################################################################
 
@@ -19,24 +16,37 @@ class GeoModel(object):
     '''Contains data references and methods for running a Geo model.
 
     Attributes:
-        self.db: an sqlite3 database connection shared for all methods
+        self.db: ConnectionManager, a read-only connection per thread
+        self.engine: lookup engine (see surgeo.model.engine) for scoring
+        self.engine_name: engine name, as passed in
+        self.cache_size: cache size, as passed in
+        self.cache: VectorCache shared by models on the same db, or None
     Methods:
+        cache_info: returns cache hit, miss and eviction counters.
         guess_race: takes zip and surname and returns a string.
         race_data: takes zip and surname and returns a GeoResult object.
+        race_data_batch: takes zips and returns a GeoResult list.
+        score_batch: takes zips and returns a SurgeoResultBatch.
         process_csv: takes to paths. Reads path one. Processed result to path 2
 
     '''
 
-    def __init__(self):
-        # Load entire db to memory for performance DISK DATABSE
+    def __init__(self, engine='sqlite', cache_size=None):
+        # engine='memory' loads the entire db to memory for performance
+        # engine='pack' memory-maps a pack file built from the db
+        # engine='shared' shares one in-memory pack with worker processes
+        # cache_size=None caches 65536 vectors for sqlite, none otherwise
         db_path = os.path.join(os.path.expanduser('~'),
                                '.surgeo',
                                'census.db')
-        if not os.path.exists(db_path):
-            raise surgeo.SurgeoError('DB does not exist. Run surgeo.data'
-                                     '_setup() or run program with '
-                                     '\'--setup\' option.')
-        self.db = sqlite3.connect(db_path)
+        self.engine_name = engine
+        self.cache_size = cache_size
+        self.db, self.engine, self.cache = surgeo.model.engine.open_engine(
+            db_path, engine, cache_size)
+
+    def cache_info(self):
+        '''Returns CacheInfo(hits, misses, evictions, maxsize, currsize).'''
+        return surgeo.model.cache.get_cache_info(self.cache)
 
     def guess_race(self, zcta):
         '''zcta and surname go in and a simple race string comes out.
@@ -49,28 +59,12 @@ class GeoModel(object):
             None
 
         '''
-        # Check for existence of zip code. Return bad result if bad.
-        try:
-            # Check for zip existence
-            cursor = self.db.cursor()
-            cursor.execute('''SELECT state, logical_record FROM
-                           geocode_data WHERE zcta=?''', (zcta,))
-            state, logical_record = cursor.fetchone()
-            result_probabilities = dict()
-            for key, value in surgeo.model.model1.race_dict.items():
-                probability = surgeo.model.model1.get_prob_zcta(key,
-                                                                zcta,
-                                                                self.db)
-                result_probabilities[key] = probability
-            result = GeoResult(zcta,
-                               result_probabilities[1],
-                               result_probabilities[2],
-                               result_probabilities[3],
-                               result_probabilities[4],
-                               result_probabilities[5],
-                               result_probabilities[6])
-        except TypeError:
+        # One query fetches all six probabilities.
+        vector = self.engine.zcta_vector(zcta)
+        if vector is None:
             result = GeoErrorResult()
+        else:
+            result = GeoResult(zcta, *vector)
         return result.probable_race
 
     def race_data(self, zcta):
@@ -85,148 +79,124 @@ class GeoModel(object):
 
         '''
 
-        # Check for existence of zip code. Return bad result if bad.
-        try:
-            # Check for zip existence
-            cursor = self.db.cursor()
-            cursor.execute('''SELECT state, logical_record FROM
-                           geocode_data WHERE zcta=?''', (zcta,))
-            state, logical_record = cursor.fetchone()
-            result_probabilities = dict()
-            for key, value in surgeo.model.model1.race_dict.items():
-                probability = surgeo.model.model1.get_prob_zcta(key,
-                                                                zcta,
-                                                                self.db)
-                result_probabilities[key] = probability
-            result = GeoResult(zcta,
-                               result_probabilities[1],
-                               result_probabilities[2],
-                               result_probabilities[3],
-                               result_probabilities[4],
-                               result_probabilities[5],
-                               result_probabilities[6])
-        except TypeError:
-            result = GeoErrorResult()
+        # One query fetches all six probabilities.
+        vector = self.engine.zcta_vector(zcta)
+        if vector is None:
+            result = GeoErrorResult(zcta)
+        else:
+            result = GeoResult(zcta, *vector)
         return result
 
+    def race_data_batch(self, zctas, summary=None):
+        '''Many zctas go in, a list of GeoResults comes out.
+
+        Args:
+            zctas: sequence of zip codes, string or int
+            summary: optional BatchSummary that receives dedup counts
+        Returns:
+            results: list of GeoResult and GeoErrorResult objects
+        Raises:
+            None
+
+        '''
+
+        return list(self.score_batch(zctas, summary))
+
+    def score_batch(self, zctas, summary=None):
+        '''Many zctas go in, a SurgeoResultBatch comes out.
+
+        Args:
+            zctas: sequence of zip codes, string or int
+            summary: optional BatchSummary that receives dedup counts
+        Returns:
+            results: SurgeoResultBatch without a surname column
+        Raises:
+            None
+
+        '''
+
+        probabilities, race_codes = surgeo.model.batch.run_model_batch(
+            zctas, None, self.engine, summary)
+        return surgeo.SurgeoResultBatch(None,
+                                        list(zctas),
+                                        probabilities,
+                                        race_codes)
+
     def process_csv(self,
                     filepath_in,
                     filepath_out,
-                    verbose=True):
+                    verbose=True,
+                    chunk_size=surgeo.utilities.csv_process.CHUNK_SIZE,
+                    workers=1):
         '''This takes a csv filepath and creates new csv with race data.
 
         Args:
             filepath_in: file path of csv from which data is read
             filepath_out: file path of csv where data is written
             verbose: True/False which determines if updates are printed
+            chunk_size: number of rows read, scored and written at a time
+            workers: number of processes scoring chunks in parallel
         Returns:
             None
         Raises:
-            None
+            SurgeoError: if row 1 lacks the needed header
+
+        Rows are streamed: memory use is bounded by chunk_size, not by the
+        size of the file. Repeats within a chunk are scored once. With
+        workers > 1 chunks are scored in a process pool and written back in
+        the original order.
 
         '''
 
-        # Open file, determine if zip and name in header
-        tempfile = open(filepath_in, 'rU')
-        number_of_rows = len(tempfile.readlines())
-        tempfile.close()
-        with open(filepath_in, 'rU') as input_csv:
-            csv_reader = csv.reader(input_csv)
-            row_1 = next(csv_reader)
-            number_of_columns = len(row_1)
-            for index, item in enumerate(row_1):
-                if type(item) is str:
-                    if 'zip' in item.lower() or 'zcta' in item.lower():
-                        zip_index = index
-            # zip/name index required. If no index for zip/name, raise error
-            try:
-                zip_index
-            except NameError:
-                raise surgeo.SurgeoError('.csv row 1 lacks \'zip\' field.')
-            # Go through all lines, amended lines with new data, and stage.
-            # Writing to string buffer rather than file.
-            line_buffer = io.StringIO()
-            csv_writer = csv.writer(line_buffer)
-            # Write header row first by splicing together
-            chopped_header_row = row_1[:number_of_columns]
-            header_remainder = ['zip', 'probable_race',
-                                'probable_race_percentage', 'hispanic',
-                                'white', 'black', 'asian_or_pi',
-                                'american_indian', 'multiracial']
-            header_row = [item for item in itertools.chain(chopped_header_row,
-                                                           header_remainder)]
-            csv_writer.writerow(header_row)
-            if verbose is True:
-                sys.stdout.write('\rReading from {}\n'.format(filepath_in))
-            # You already did a next() before on the iterator, line 2
-            for index, entry in enumerate(csv_reader, start=1):
-                zcta = entry[zip_index]
-                # Invoke object's race_data
-                try:
-                    # Check for zip existence
-                    cursor = self.db.cursor()
-                    cursor.execute('''SELECT state, logical_record FROM
-                                   geocode_data WHERE zcta=?''', (zcta,))
-                    state, logical_record = cursor.fetchone()
-                    result_probabilities = dict()
-                    for key, value in surgeo.model.model1.race_dict.items():
-                            probability = surgeo.model.model1.get_prob_zcta(
-                                key, zcta, self.db)
-                            result_probabilities[key] = probability
-                    result = GeoResult(zcta,
-                                       result_probabilities[1],
-                                       result_probabilities[2],
-                                       result_probabilities[3],
-                                       result_probabilities[4],
-                                       result_probabilities[5],
-                                       result_probabilities[6])
-                except TypeError:
-                    result = GeoErrorResult()
-                result_list = [result.zcta,
-                               result.probable_race,
-                               result.probable_race_percentage,
-                               result.hispanic,
-                               result.white,
-                               result.black,
-                               result.asian_or_pi,
-                               result.american_indian,
-                               result.multiracial]
-                # Chop row in the event that rows are a different length
-                chopped_row = entry[:number_of_columns]
-                # Splice new row together
-                new_row = [item for item in
-                           itertools.chain(chopped_row, result_list)]
-                csv_writer.writerow(new_row)
-            if verbose is True:
-                sys.stdout.write('Writing to {}.'.format(filepath_out))
-            with open(filepath_out, 'w+') as f:
-                f.write(line_buffer.getvalue())
-            line_buffer.close()
-            if verbose is True:
-                sys.stdout.write('\nComplete.\n')
+        summary = surgeo.model.batch.BatchSummary()
+        header_remainder = ['zip', 'probable_race',
+                            'probable_race_percentage', 'hispanic',
+                            'white', 'black', 'asian_or_pi',
+                            'american_indian', 'multiracial']
+        surgeo.utilities.csv_process.process_csv(
+            filepath_in,
+            filepath_out,
+            [surgeo.utilities.csv_process.ZIP_PATTERNS],
+            '.csv row 1 lacks \'zip\' field.',
+            header_remainder,
+            self,
+            summary,
+            chunk_size,
+            verbose,
+            workers)
+        if verbose is True:
+            sys.stdout.write('Scored {}.\n'.format(summary))
+            sys.stdout.write('Complete.\n')
 
 
 ###############################################################################
 
 
-class GeoResult(object):
+class GeoResult(surgeo.utilities.result_class.BaseResult):
     '''Result class containing BISG data.
 
     Attributes:
         self.zcta: string
-        self.zip: string
+        self.zip: @property string (same as zcta)
         self.hispanic: float
         self.white: float
         self.black: float
         self.asian_or_pi: float
         self.american_indian: float
         self.multiracial: float
+        self.race_code: int, 1-6 (argmax, computed once)
         self.probable_race: @property string
         self.probable_race_percentage: @property float
         self.as_string: @property string
+        self.as_csv: @property string
+        self.as_row: @property list
 
     '''
 
+    __slots__ = ('zcta',)
+
+    _key_fields = (('zip', 'zcta'),)
+
     def __init__(self,
                  zcta,
                  hispanic,
@@ -234,69 +204,28 @@ class GeoResult(object):
                  black,
                  asian_or_pi,
                  american_indian,
-                 multiracial):
+                 multiracial,
+                 race_code=None):
         self.zcta = zcta
-        self.zip = zcta
-        self.hispanic = '{0:f}'.format(hispanic)
-        self.white = '{0:f}'.format(white)
-        self.black = '{0:f}'.format(black)
-        self.asian_or_pi = '{0:f}'.format(asian_or_pi)
-        self.american_indian = '{0:f}'.format(american_indian)
-        self.multiracial = '{0:f}'.format(multiracial)
+        self._set_probabilities(hispanic,
+                                white,
+                                black,
+                                asian_or_pi,
+                                american_indian,
+                                multiracial,
+                                race_code)
 
     @property
-    def probable_race(self):
-        rank_dict = {'Hispanic': self.hispanic,
-                     'White': self.white,
-                     'Black': self.black,
-                     'Asian / Pacific Islander': self.asian_or_pi,
-                     'American Indian / Alaskan Eskimo': self.american_indian,
-                     'Multiracial': self.multiracial}
-        most_probable_race = sorted(rank_dict.items(),
-                                    key=operator.itemgetter(1),
-                                    reverse=True)[0][0]
-        return most_probable_race
-
-    @property
-    def probable_race_percentage(self):
-        return max(self.hispanic,
-                   self.white,
-                   self.black,
-                   self.asian_or_pi,
-                   self.american_indian,
-                   self.multiracial)
-
-    @property
-    def as_string(self):
-        string = '\n'.join(['probable_race={}'.format(self.probable_race),
-                            'probable_race_percent={}'.
-                            format(self.probable_race_percentage),
-                            'zip={}'.format(self.zcta),
-                            'hispanic={}'.format(self.hispanic),
-                            'white={}'.format(self.white),
-                            'black={}'.format(self.black),
-                            'asian={}'.format(self.asian_or_pi),
-                            'indian={}'.format(self.american_indian),
-                            'multiracial={}'.format(self.multiracial)])
-        return string
-
-    @property
-    def as_csv(self):
-        original_string = str(self.as_string)
-        original_as_list = original_string.split('\n')
-        # Get rid of 'probable_race='
-        original_as_list = [item.partition('=')[2] for item in
-                            original_as_list]
-        # Get rid of empties, and turn to csv
-        original_as_list = [''.join(['\"', item, '\"']) for item in
-                            original_as_list if item is not None]
-        csv_string = ','.join(original_as_list) + '\n'
-        return csv_string
+    def zip(self):
+        return self.zcta
 
 
 class GeoErrorResult(object):
     '''Result class containing error data.
 
+    The zcta that could not be scored is echoed when given; otherwise it
+    reads '00000'.
+
     Attributes:
         self.surname: string
         self.zcta: string
@@ -309,13 +238,14 @@ class GeoErrorResult(object):
         self.multiracial: float
         self.probable_race: @property string
         self.probable_race_percentage: @property float
-        self.as_string: @property string
+        self.as_string: string
+        self.as_row: list
 
     '''
 
-    def __init__(self):
-        self.zcta = '00000'
-        self.zip = '00000'
+    def __init__(self, zcta=None):
+        self.zcta = '00000' if zcta is None else zcta
+        self.zip = self.zcta
         self.hispanic = 0
         self.white = 0
         self.black = 0
@@ -324,9 +254,11 @@ class GeoErrorResult(object):
         self.multiracial = 0
         self.probable_race = 'Error'
         self.probable_race_percentage = 0
+        self.race_code = 0
+        self.as_row = [self.zcta, 'Error', 0, 0, 0, 0, 0, 0, 0]
         self.as_string = '\n'.join(['probable_race=Error',
                                     'probable_race_percent=Error',
-                                    'zip=Error',
+                                    'zip={}'.format(zcta or 'Error'),
                                     'hispanic=Error',
                                     'white=Error',
                                     'black=Error',
@@ -1,7 +1,4 @@
 
-import argparse
-
-
 def get_parser_args():
     '''This creates a parser and is invoked from main program.
 
@@ -14,12 +11,27 @@ def get_parser_args():
 
     '''
 
+    # Imported here so that 'import surgeo' in a program does not load it
+    import argparse
     parser = argparse.ArgumentParser(description='Get Surgeo arguments.')
     # File argumets
     parser.add_argument('--file',
                         nargs=2,
                         help='Takes input file and output file as arguments.',
                         dest='file')
+    # Parallel file processing
+    parser.add_argument('--jobs',
+                        type=int,
+                        default=1,
+                        help='Number of processes used with --file or '
+                             '--setup.',
+                        dest='jobs')
+    # Lookup engine
+    parser.add_argument('--engine',
+                        choices=('sqlite', 'memory', 'pack', 'shared'),
+                        default='sqlite',
+                        help='Lookup engine used by the model.',
+                        dest='engine')
     # Simple arguments
     parser.add_argument('--simple',
                         nargs=2,
@@ -35,11 +47,59 @@ def get_parser_args():
                         action='store_true',
                         help='Takes no arguments. Used only for piping.',
                         dest='pipe')
+    # Pipe output format
+    parser.add_argument('--format',
+                        choices=('text', 'tsv', 'csv', 'jsonl'),
+                        default='text',
+                        help='Output format used with --pipe.',
+                        dest='format')
+    # Server arguments
+    parser.add_argument('--serve',
+                        action='store_true',
+                        help='Serves JSON scoring requests until stopped.',
+                        dest='serve')
+    parser.add_argument('--host',
+                        default='127.0.0.1',
+                        help='Address used with --serve.',
+                        dest='host')
+    parser.add_argument('--port',
+                        type=int,
+                        default=8000,
+                        help='TCP port used with --serve.',
+                        dest='port')
+    parser.add_argument('--socket',
+                        help='Unix socket path used with --serve.',
+                        dest='socket')
+    parser.add_argument('--batch-window',
+                        type=float,
+                        default=2.0,
+                        help='Milliseconds --serve waits to batch requests.',
+                        dest='batch_window')
+    parser.add_argument('--max-batch',
+                        type=int,
+                        default=1024,
+                        help='Records at which --serve scores a batch.',
+                        dest='max_batch')
     # Setup argument
     parser.add_argument('--setup',
                         action='store_true',
                         help='Takes no inputs and sets up database.',
                         dest='setup')
+    parser.add_argument('--from-dir',
+                        help='Directory or mirror holding the census '
+                             'archives used by --setup instead of '
+                             'downloading them.',
+                        dest='from_dir')
+    parser.add_argument('--rebuild',
+                        action='store_true',
+                        help='With --setup, discards census.db and builds '
+                             'it from scratch instead of resuming.',
+                        dest='rebuild')
+    parser.add_argument('--migrate-db',
+                        action='store_true',
+                        help='Upgrades census.db in place to the current '
+                             'schema and analyzes it.',
+                        dest='migrate_db')
     #parse and return args
     parsed_args = parser.parse_args()
     return parsed_args
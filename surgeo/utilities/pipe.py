@@ -0,0 +1,133 @@
+'''Block-at-a-time scoring of stdin for the --pipe option.
+
+   Each input line is a zip code and a surname separated by whitespace.
+   Whatever input is available is read as one block, scored with a single
+   batch lookup, and written with a single buffered write, so pipe mode
+   keeps up with high volume yet still answers interactive input promptly.'''
+
+import csv
+import io
+import json
+
+import surgeo
+
+# Output formats. 'text' is the multi-line as_string of earlier versions.
+FORMATS = ('text', 'tsv', 'csv', 'jsonl')
+
+# Largest number of bytes read from stdin at a time
+BLOCK_SIZE = 1 << 20
+
+# Key used for lines that are not a zip and a surname
+BAD_LINE = ('00000', 'BAD_NAME')
+
+
+def iter_line_blocks(stream, block_size=BLOCK_SIZE):
+    '''Yields lists of complete lines, as many as are available at once.
+
+    Args:
+        stream: text stream such as sys.stdin
+        block_size: largest number of bytes read at a time
+    Returns:
+        generator of lists of strings
+    Raises:
+        None
+
+    '''
+
+    raw = getattr(stream, 'buffer', None)
+    if raw is None or not hasattr(raw, 'read1'):
+        # Plain text streams (e.g. io.StringIO) are read in line blocks
+        lines = []
+        for line in stream:
+            lines.append(line)
+            if len(lines) >= 10000:
+                yield lines
+                lines = []
+        if lines:
+            yield lines
+        return
+    remainder = b''
+    while True:
+        data = raw.read1(block_size)
+        if not data:
+            break
+        data = remainder + data
+        cut = data.rfind(b'\n') + 1
+        remainder = data[cut:]
+        if cut:
+            yield data[:cut].decode(stream.encoding or 'utf-8',
+                                    'replace').splitlines()
+    if remainder:
+        yield remainder.decode(stream.encoding or 'utf-8',
+                               'replace').splitlines()
+
+
+def parse_lines(lines):
+    '''Splits lines into (zctas, surnames). Bad lines get BAD_LINE.'''
+    zctas = []
+    surnames = []
+    for line in lines:
+        fields = line.strip().split()
+        if len(fields) != 2:
+            fields = BAD_LINE
+        zctas.append(fields[0])
+        surnames.append(fields[1])
+    return zctas, surnames
+
+
+def format_batch(results, output_format):
+    '''Returns the text for a SurgeoResultBatch, one record per line.
+
+    Args:
+        results: SurgeoResultBatch
+        output_format: one of FORMATS
+    Returns:
+        string
+    Raises:
+        SurgeoError: if the format is unknown
+
+    tsv and csv rows are in the column order of results.columns and have
+    no header. jsonl writes one JSON object per record with probabilities
+    as numbers and null for records that could not be scored.
+
+    '''
+
+    if output_format == 'text':
+        return ''.join(result.as_string + '\n' for result in results)
+    if output_format in ('tsv', 'csv'):
+        line_buffer = io.StringIO()
+        delimiter = '\t' if output_format == 'tsv' else ','
+        csv.writer(line_buffer,
+                   delimiter=delimiter,
+                   lineterminator='\n').writerows(results.iter_rows())
+        return line_buffer.getvalue()
+    if output_format == 'jsonl':
+        return ''.join(json.dumps(record) + '\n'
+                       for record in results.iter_records())
+    raise surgeo.SurgeoError('Unknown format \'{}\'. Choose from {}.'
+                             .format(output_format, ', '.join(FORMATS)))
+
+
+def run_pipe(model, stream_in, stream_out, output_format='text'):
+    '''Scores zip/surname lines from stream_in and writes to stream_out.
+
+    Args:
+        model: SurgeoModel instance
+        stream_in: text stream of 'zip surname' lines
+        stream_out: text stream that results are written to
+        output_format: one of FORMATS
+    Returns:
+        None
+    Raises:
+        SurgeoError: if the format is unknown
+
+    '''
+
+    if output_format not in FORMATS:
+        raise surgeo.SurgeoError('Unknown format \'{}\'. Choose from {}.'
+                                 .format(output_format, ', '.join(FORMATS)))
+    for lines in iter_line_blocks(stream_in):
+        zctas, surnames = parse_lines(lines)
+        results = model.score_batch(zctas, surnames)
+        stream_out.write(format_batch(results, output_format))
+        stream_out.flush()
@@ -0,0 +1,115 @@
+'''This is the shared base for SurgeoResult, SurResult and GeoResult.
+
+   Probabilities are kept as floats in __slots__. The most probable race is
+   found once, when the result is built, and strings are only formatted when
+   as_string, as_csv or as_row is read.'''
+
+# Names used by probable_race, in model race order (race code 1-6)
+RACE_NAMES = ('Hispanic',
+              'White',
+              'Black',
+              'Asian / Pacific Islander',
+              'American Indian / Alaskan Eskimo',
+              'Multiracial')
+
+
+class BaseResult(object):
+    '''Result base class containing six race probabilities.
+
+    Attributes:
+        self.hispanic: float
+        self.white: float
+        self.black: float
+        self.asian_or_pi: float
+        self.american_indian: float
+        self.multiracial: float
+        self.race_code: int, 1-6 in model race order
+        self.probable_race: @property string
+        self.probable_race_percentage: @property float
+        self.probabilities: @property tuple of the six floats
+
+    Subclasses set _key_fields, a tuple of (label, attribute) pairs that
+    as_string lists after probable_race_percent.
+
+    '''
+
+    __slots__ = ('hispanic',
+                 'white',
+                 'black',
+                 'asian_or_pi',
+                 'american_indian',
+                 'multiracial',
+                 'race_code')
+
+    _key_fields = ()
+
+    def _set_probabilities(self,
+                           hispanic,
+                           white,
+                           black,
+                           asian_or_pi,
+                           american_indian,
+                           multiracial,
+                           race_code):
+        self.hispanic = hispanic
+        self.white = white
+        self.black = black
+        self.asian_or_pi = asian_or_pi
+        self.american_indian = american_indian
+        self.multiracial = multiracial
+        if race_code is None:
+            # First of equal maxima wins
+            probabilities = (hispanic, white, black, asian_or_pi,
+                             american_indian, multiracial)
+            race_code = probabilities.index(max(probabilities)) + 1
+        self.race_code = race_code
+
+    @property
+    def probabilities(self):
+        return (self.hispanic,
+                self.white,
+                self.black,
+                self.asian_or_pi,
+                self.american_indian,
+                self.multiracial)
+
+    @property
+    def probable_race(self):
+        return RACE_NAMES[self.race_code - 1]
+
+    @property
+    def probable_race_percentage(self):
+        return self.probabilities[self.race_code - 1]
+
+    def _formatted_values(self):
+        '''Returns as_string values in order, without their labels.'''
+        values = [self.probable_race,
+                  '{0:f}'.format(self.probable_race_percentage)]
+        values.extend(str(getattr(self, attribute)) for label, attribute in
+                      self._key_fields)
+        values.extend('{0:f}'.format(prob) for prob in self.probabilities)
+        return values
+
+    @property
+    def as_string(self):
+        labels = ['probable_race', 'probable_race_percent']
+        labels.extend(label for label, attribute in self._key_fields)
+        labels.extend(['hispanic', 'white', 'black', 'asian', 'indian',
+                       'multiracial'])
+        return '\n'.join('{}={}'.format(label, value) for label, value in
+                         zip(labels, self._formatted_values()))
+
+    @property
+    def as_csv(self):
+        return ','.join('"{}"'.format(value) for value in
+                        self._formatted_values()) + '\n'
+
+    @property
+    def as_row(self):
+        '''Values in process_csv column order: keys, race, percent, six.'''
+        row = [getattr(self, attribute) for label, attribute in
+               self._key_fields]
+        row.append(self.probable_race)
+        row.append('{0:f}'.format(self.probable_race_percentage))
+        row.extend('{0:f}'.format(prob) for prob in self.probabilities)
+        return row
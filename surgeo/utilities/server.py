@@ -0,0 +1,486 @@
+'''Long-running scoring server for the --serve option.
+
+   Keeps warm SurgeoModel, SurModel and GeoModel instances and answers JSON
+   scoring requests over HTTP or a Unix domain socket, so callers do not pay
+   for an import and a database open on every request.
+
+   Endpoints:
+       GET  /health   {"status": "ok", "models": [...], "requests": n}
+       GET  /metrics  latency percentiles and histograms (see ServiceStats)
+       POST /surgeo   {"zip": "63110", "surname": "Jones"}
+       POST /sur      {"surname": "Jones"}
+       POST /geo      {"zip": "63110"}
+
+   A POST body may instead hold {"records": [{...}, ...]}, which is scored
+   as one batch and answered with {"results": [...]}. Results have the keys
+   of SurgeoResultBatch.iter_records.
+
+   Requests that arrive within a short window of each other are scored
+   together: the scoring thread gathers queued requests for up to
+   batch_window seconds or max_batch records, scores each model's share
+   with one score_batch call and hands every caller its own slice.'''
+
+import bisect
+import collections
+import concurrent.futures
+import http.server
+import itertools
+import json
+import math
+import os
+import queue
+import socketserver
+import sys
+import threading
+import time
+
+import surgeo
+
+# Model name: (model class attribute on surgeo, request keys in
+# score_batch argument order)
+MODELS = {'surgeo': ('SurgeoModel', ('zip', 'surname')),
+          'sur': ('SurModel', ('surname',)),
+          'geo': ('GeoModel', ('zip',))}
+
+# Largest request body accepted, in bytes
+MAX_BODY = 64 * 1024 * 1024
+
+# Seconds the scoring thread waits for more requests to join a batch
+BATCH_WINDOW = 0.002
+
+# Records at which a batch is scored without waiting out the window
+MAX_BATCH = 1024
+
+# Upper bounds of the latency (milliseconds) and batch size histograms
+LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096, 16384)
+
+# Number of recent request latencies kept for percentiles
+LATENCY_SAMPLES = 10000
+
+
+class ServiceStats(object):
+    '''Latency and batch size counters for a ScoringService.
+
+    Attributes:
+        self.requests: number of scoring requests answered
+        self.batches: number of score_batch calls made
+    Methods:
+        add_latency: records the seconds one request spent queued and scored.
+        add_batch: records the number of records in one score_batch call.
+        snapshot: returns the counters as a dict suited to JSON.
+
+    Percentiles are taken over the most recent LATENCY_SAMPLES requests.
+    Histograms count since start; each bucket is labelled with its upper
+    bound and the last bucket ('inf') holds everything larger.
+
+    '''
+
+    def __init__(self):
+        self.requests = 0
+        self.batches = 0
+        self._lock = threading.Lock()
+        self._latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+        self._latency_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self._batch_counts = [0] * (len(BATCH_BUCKETS) + 1)
+
+    def add_latency(self, seconds):
+        milliseconds = seconds * 1000
+        with self._lock:
+            self.requests += 1
+            self._latencies.append(milliseconds)
+            self._latency_counts[bisect.bisect_left(LATENCY_BUCKETS,
+                                                    milliseconds)] += 1
+
+    def add_batch(self, size):
+        with self._lock:
+            self.batches += 1
+            self._batch_counts[bisect.bisect_left(BATCH_BUCKETS, size)] += 1
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            latency_counts = list(self._latency_counts)
+            batch_counts = list(self._batch_counts)
+            requests = self.requests
+            batches = self.batches
+        return {'requests': requests,
+                'batches': batches,
+                'latency_ms': {'p50': _percentile(latencies, 0.50),
+                               'p99': _percentile(latencies, 0.99)},
+                'latency_ms_histogram': _histogram(LATENCY_BUCKETS,
+                                                   latency_counts),
+                'batch_size_histogram': _histogram(BATCH_BUCKETS,
+                                                   batch_counts)}
+
+
+def _percentile(ordered, fraction):
+    '''Nearest-rank percentile of a sorted list, or None if it is empty.'''
+    if not ordered:
+        return None
+    rank = max(int(math.ceil(fraction * len(ordered))), 1)
+    return ordered[rank - 1]
+
+
+def _histogram(bounds, counts):
+    '''Returns [[upper bound, count], ...] with 'inf' as the last bound.'''
+    return [[bound, count] for bound, count in
+            zip(list(bounds) + ['inf'], counts)]
+
+
+class ScoringService(object):
+    '''Owns the warm models and scores requests on a single thread.
+
+    Attributes:
+        self.models: dict of model name to model instance
+        self.batch_window: seconds to wait for requests to join a batch
+        self.max_batch: records at which a batch is scored at once
+        self.stats: ServiceStats with latency and batch size counters
+        self.requests: @property number of scoring requests answered
+    Methods:
+        start: builds the models and starts the scoring thread.
+        stop: stops the scoring thread.
+        score: scores one request, blocking until the answer is ready.
+
+    Request handler threads hand work to the scoring thread through a
+    queue rather than scoring themselves, so that requests queued together
+    are scored together (see the module docstring). A window of 0 batches
+    only what is already queued.
+
+    '''
+
+    def __init__(self,
+                 engine='sqlite',
+                 cache_size=None,
+                 batch_window=BATCH_WINDOW,
+                 max_batch=MAX_BATCH):
+        self.engine_name = engine
+        self.cache_size = cache_size
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.models = {}
+        self.stats = ServiceStats()
+        self._queue = queue.Queue()
+        self._thread = None
+
+    @property
+    def requests(self):
+        return self.stats.requests
+
+    def start(self):
+        '''Builds the models and starts the scoring thread.
+
+        Args:
+            None
+        Returns:
+            None
+        Raises:
+            SurgeoError: if the database does not exist
+
+        '''
+
+        ready = concurrent.futures.Future()
+        self._thread = threading.Thread(target=self._run,
+                                        args=(ready,),
+                                        name='surgeo-scoring',
+                                        daemon=True)
+        self._thread.start()
+        ready.result()
+
+    def stop(self):
+        '''Stops the scoring thread once queued requests are answered.'''
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def score(self, model_name, key_columns):
+        '''Scores key columns with a model and returns a SurgeoResultBatch.
+
+        Args:
+            model_name: key of MODELS
+            key_columns: list of lists, in score_batch argument order
+        Returns:
+            SurgeoResultBatch
+        Raises:
+            SurgeoError: if scoring fails
+
+        '''
+
+        future = concurrent.futures.Future()
+        self._queue.put((model_name, key_columns, future,
+                         time.perf_counter()))
+        return future.result()
+
+    def _run(self, ready):
+        try:
+            for name, (class_name, _) in MODELS.items():
+                model_class = getattr(surgeo, class_name)
+                self.models[name] = model_class(engine=self.engine_name,
+                                                cache_size=self.cache_size)
+        except BaseException as error:
+            ready.set_exception(error)
+            return
+        ready.set_result(None)
+        running = True
+        while running:
+            jobs, running = self._collect()
+            grouped = collections.OrderedDict()
+            for job in jobs:
+                grouped.setdefault(job[0], []).append(job)
+            for model_name, model_jobs in grouped.items():
+                self._score_jobs(model_name, model_jobs)
+
+    def _collect(self):
+        '''Returns (queued jobs for one batch, False once stop is asked).'''
+        job = self._queue.get()
+        if job is None:
+            return [], False
+        jobs = [job]
+        records = len(job[1][0])
+        deadline = time.perf_counter() + self.batch_window
+        while records < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            try:
+                if timeout > 0:
+                    job = self._queue.get(timeout=timeout)
+                else:
+                    job = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                return jobs, False
+            jobs.append(job)
+            records += len(job[1][0])
+        return jobs, True
+
+    def _score_jobs(self, model_name, jobs):
+        '''Scores jobs for one model in one call and answers each one.'''
+        if len(jobs) == 1:
+            key_columns = jobs[0][1]
+        else:
+            key_columns = [list(itertools.chain.from_iterable(
+                               job[1][column] for job in jobs))
+                           for column in range(len(jobs[0][1]))]
+        try:
+            results = self.models[model_name].score_batch(*key_columns)
+        except Exception as error:
+            for job in jobs:
+                job[2].set_exception(error)
+            return
+        self.stats.add_batch(len(results))
+        start = 0
+        for _, job_columns, future, queued in jobs:
+            stop = start + len(job_columns[0])
+            future.set_result(results if len(jobs) == 1 else
+                              results[start:stop])
+            start = stop
+            self.stats.add_latency(time.perf_counter() - queued)
+
+
+def parse_records(body, keys):
+    '''Returns the key columns of a decoded request body.
+
+    Args:
+        body: decoded JSON, a record or {"records": [record, ...]}
+        keys: record keys, in score_batch argument order
+    Returns:
+        list of lists of strings, one list per key
+    Raises:
+        ValueError: with a message for the caller, if body is malformed or
+            a key is missing or is not a string or a number
+
+    '''
+
+    if not isinstance(body, dict):
+        raise ValueError('body must be a JSON object.')
+    if 'records' in body:
+        records = body['records']
+        if not isinstance(records, list):
+            raise ValueError('"records" must be a list of objects.')
+    else:
+        records = [body]
+    key_columns = [[] for _ in keys]
+    for index, record in enumerate(records):
+        if not isinstance(record, dict):
+            raise ValueError('record {} is not an object.'.format(index))
+        for key, column in zip(keys, key_columns):
+            value = record.get(key)
+            # bool is an int, but true is no zip code
+            if (isinstance(value, bool) or
+                    not isinstance(value, (str, int, float))):
+                raise ValueError('record {} needs "{}" as a string or a '
+                                 'number.'.format(index, key))
+            column.append(str(value))
+    return key_columns
+
+
+class ScoringHandler(http.server.BaseHTTPRequestHandler):
+    '''Answers health checks and JSON scoring requests.'''
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        path = self.path.rstrip('/')
+        service = self.server.service
+        if path == '/metrics':
+            metrics = service.stats.snapshot()
+            metrics['batch_window_ms'] = service.batch_window * 1000
+            metrics['max_batch'] = service.max_batch
+            self._send_json(200, metrics)
+            return
+        if path != '/health':
+            self._send_json(404, {'error': 'Not found.'})
+            return
+        self._send_json(200, {'status': 'ok',
+                              'models': sorted(service.models),
+                              'engine': service.engine_name,
+                              'requests': service.requests})
+
+    def do_POST(self):
+        model_name = self.path.strip('/')
+        # The body is framed by Content-Length alone. Without a usable
+        # one the rest of the stream cannot be parsed, so the connection
+        # is closed after answering.
+        try:
+            length = int(self.headers.get('Content-Length', ''))
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True
+            self._send_json(400, {'error': 'Bad request: a valid '
+                                           'Content-Length is required.'})
+            return
+        if length > MAX_BODY:
+            self.close_connection = True
+            self._send_json(413, {'error': 'Request body too large.'})
+            return
+        if model_name not in MODELS:
+            # Drain the body so the next request on a keep-alive
+            # connection starts where it should
+            self.rfile.read(length)
+            self._send_json(404, {'error': 'Not found.'})
+            return
+        data = self.rfile.read(length)
+        try:
+            body = json.loads(data.decode('utf-8'))
+        except ValueError:
+            self._send_json(400, {'error': 'Bad request: body is not '
+                                           'UTF-8 JSON.'})
+            return
+        try:
+            key_columns = parse_records(body, MODELS[model_name][1])
+        except ValueError as error:
+            self._send_json(400, {'error': 'Bad request: {}'.format(error)})
+            return
+        try:
+            results = self.server.service.score(model_name, key_columns)
+        except Exception as error:
+            self._send_json(500, {'error': str(error)})
+            return
+        answers = list(results.iter_records())
+        if 'records' in body:
+            self._send_json(200, {'results': answers})
+        else:
+            self._send_json(200, answers[0])
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # Unix domain socket clients have no host address
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return 'unix'
+
+    def log_message(self, format, *args):
+        if self.server.verbose is True:
+            http.server.BaseHTTPRequestHandler.log_message(self, format,
+                                                           *args)
+
+
+class ScoringHTTPServer(http.server.ThreadingHTTPServer):
+    '''Threaded TCP server for ScoringHandler.'''
+
+    def __init__(self, address, service, verbose=False):
+        self.service = service
+        self.verbose = verbose
+        http.server.ThreadingHTTPServer.__init__(self,
+                                                 address,
+                                                 ScoringHandler)
+
+
+class ScoringUnixServer(socketserver.ThreadingMixIn,
+                        socketserver.UnixStreamServer):
+    '''Threaded Unix domain socket server for ScoringHandler.'''
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, service, verbose=False):
+        self.service = service
+        self.verbose = verbose
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        socketserver.UnixStreamServer.__init__(self,
+                                               socket_path,
+                                               ScoringHandler)
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+def serve(host='127.0.0.1',
+          port=8000,
+          socket_path=None,
+          engine='sqlite',
+          cache_size=None,
+          batch_window=BATCH_WINDOW,
+          max_batch=MAX_BATCH,
+          verbose=True):
+    '''Serves scoring requests until interrupted.
+
+    Args:
+        host: address to listen on for HTTP
+        port: TCP port to listen on for HTTP
+        socket_path: if given, listen on this Unix socket instead of TCP
+        engine: lookup engine for the models, one of
+            surgeo.model.engine.ENGINES ('sqlite', 'memory',
+            'pack' or 'shared')
+        cache_size: vector cache size for the models (see SurgeoModel)
+        batch_window: seconds to wait for requests to join a batch
+        max_batch: records at which a batch is scored without waiting
+        verbose: True/False which determines if updates are printed
+    Returns:
+        None
+    Raises:
+        SurgeoError: if the database does not exist
+
+    '''
+
+    service = ScoringService(engine, cache_size, batch_window, max_batch)
+    service.start()
+    if socket_path is not None:
+        server = ScoringUnixServer(socket_path, service, verbose)
+        where = 'unix:{}'.format(socket_path)
+    else:
+        server = ScoringHTTPServer((host, port), service, verbose)
+        where = 'http://{}:{}'.format(*server.server_address[:2])
+    if verbose is True:
+        sys.stdout.write('Serving on {}\n'.format(where))
+        sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()